@@ -1,9 +1,30 @@
+import time
+_run_started = time.perf_counter()
+
 import streamlit as st
-import pandas as pd
 import json
+import os
+import random
+import re
 import requests
 from datetime import datetime, date, timedelta
 import calendar
+import copy
+import csv
+import io
+import sqlite3
+import threading
+import atexit
+import bisect
+import functools
+import hmac
+import logging
+from collections import OrderedDict, deque
+from itertools import accumulate, chain
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas           # imported on first use at runtime, as pd where it's needed
 
 # ─────────────────────────────────────────────
 # PAGE CONFIG
@@ -15,10 +36,156 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
+# ─────────────────────────────────────────────
+# PERFORMANCE INSTRUMENTATION
+# ─────────────────────────────────────────────
+# Each script run (and each card fragment rerun) gets a trace: time spent in
+# every section of the script, gist GET / PATCH time and bytes, JSON encode /
+# decode time and how often the main helpers were called. A finished trace is
+# logged to "tuition.perf" as one JSON line and kept for the diagnostics page,
+# which appears in the nav with ?diagnostics in the URL or DIAGNOSTICS = true
+# in secrets. Work outside a script run (the background saver) is added up in
+# a trace of its own.
+
+perf_log = logging.getLogger("tuition.perf")
+if not perf_log.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(message)s"))
+    perf_log.addHandler(_handler)
+    perf_log.setLevel(logging.INFO)
+    perf_log.propagate = False
+
+class PerfTrace:
+    """Timings and counters for one run."""
+
+    def __init__(self, label, page=None):
+        self.label    = label
+        self.page     = page
+        self.started  = datetime.now()
+        self.last     = time.perf_counter()
+        self.sections = {}      # script section → seconds
+        self.spans    = {}      # "gist.get", "json.decode", ... → [count, seconds, bytes]
+        self.calls    = {}      # helper → [count, seconds]
+        self.status   = "running"
+        self._lock    = threading.Lock()
+
+    def add(self, name, seconds, nbytes=0):
+        with self._lock:
+            span = self.spans.setdefault(name, [0, 0.0, 0])
+            span[0] += 1
+            span[1] += seconds
+            span[2] += nbytes
+
+    def count(self, name, seconds):
+        with self._lock:
+            call = self.calls.setdefault(name, [0, 0.0])
+            call[0] += 1
+            call[1] += seconds
+
+    def section(self, name):
+        now = time.perf_counter()
+        self.sections[name] = self.sections.get(name, 0.0) + now - self.last
+        self.last = now
+
+    def summary(self) -> dict:
+        ms = lambda s: round(s * 1000, 2)
+        with self._lock:
+            return {
+                "run":      self.label,
+                "page":     self.page,
+                "status":   self.status,
+                "at":       self.started.isoformat(timespec="seconds"),
+                "total_ms": ms(sum(self.sections.values())),
+                "sections": {k: ms(v) for k, v in self.sections.items()},
+                "spans":    {k: {"n": n, "ms": ms(s), "bytes": b} for k, (n, s, b) in self.spans.items()},
+                "calls":    {k: {"n": n, "ms": ms(s)} for k, (n, s) in self.calls.items()},
+            }
+
+
+class PerfLog:
+    """The last `size` finished traces, plus the running background trace."""
+
+    def __init__(self, size):
+        self.runs       = deque(maxlen=size)
+        self.background = PerfTrace("background")
+
+    def record(self, trace):
+        summary = trace.summary()
+        self.runs.append(summary)
+        perf_log.info(json.dumps(summary, separators=(",", ":")))
+
+
+@st.cache_resource
+def get_perf_log() -> PerfLog:
+    return PerfLog(200)
+
+_perf = threading.local()       # the trace of the run executing on this thread
+
+def current_trace() -> PerfTrace:
+    return getattr(_perf, "trace", None) or get_perf_log().background
+
+def perf_add(name, started, nbytes=0):
+    """Record a span that began at perf_counter() value `started`."""
+    current_trace().add(name, time.perf_counter() - started, nbytes)
+
+def counted(fn):
+    """Count calls to `fn` and the time spent in them on the current trace."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            current_trace().count(fn.__qualname__, time.perf_counter() - started)
+    return wrapper
+
+def _finish_trace(trace, status):
+    trace.status = status
+    get_perf_log().record(trace)
+    if getattr(_perf, "trace", None) is trace:
+        _perf.trace = None
+
+def begin_rerun(started):
+    # a run cut short by st.rerun() never reached the footer; close it now
+    previous = st.session_state.get("perf_trace")
+    if previous is not None and previous.status == "running":
+        _finish_trace(previous, "rerun")
+    trace = _perf.trace = st.session_state.perf_trace = PerfTrace("script", st.session_state.get("page", "home"))
+    trace.last = started
+    trace.section("imports")
+    return trace
+
+def perf_section(name):
+    trace = getattr(_perf, "trace", None)
+    if trace is not None:
+        trace.section(name)
+
+def end_rerun():
+    trace = getattr(_perf, "trace", None)
+    if trace is not None:
+        trace.page = st.session_state.get("page", trace.page)
+        _finish_trace(trace, "ok")
+
+def traced_fragment(fn):
+    """Give a fragment rerun its own trace; inside a full run it's just a section."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if getattr(_perf, "trace", None) is not None:
+            return fn(*args, **kwargs)
+        trace = _perf.trace = PerfTrace(f"fragment:{fn.__name__}", st.session_state.get("page"))
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            trace.section(fn.__name__)
+            _finish_trace(trace, "ok")
+    return wrapper
+
+begin_rerun(_run_started)
+
 # ─────────────────────────────────────────────
 # MOBILE-FRIENDLY CSS  (Streamlit elements only)
 # ─────────────────────────────────────────────
-st.markdown("""
+APP_CSS = """
 <style>
 /* ── global typography ── */
 html, body, [class*="css"] { font-family: 'Segoe UI', sans-serif; }
@@ -84,7 +251,15 @@ input, textarea, select {
 /* ── reduce page padding on mobile ── */
 .block-container { padding: 1rem 0.75rem 3rem !important; }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+@st.cache_resource
+def minified_css() -> str:
+    """APP_CSS without comments and indentation, built once per server process."""
+    css = re.sub(r"/\*.*?\*/", "", APP_CSS, flags=re.S)
+    return re.sub(r"\s*\n\s*", "", css)
+
+st.markdown(minified_css(), unsafe_allow_html=True)
 
 
 # ─────────────────────────────────────────────
@@ -100,41 +275,1579 @@ input, textarea, select {
 #   3. Create a new Gist at gist.github.com with a file called tuition_data.json containing: {}
 #   4. Copy the Gist ID from the URL
 #   5. Add token + gist_id to your Streamlit app secrets
-
-GIST_FILENAME = "tuition_data.json"
-
-def _gist_headers():
-    token = st.secrets.get("GITHUB_TOKEN", "")
-    return {"Authorization": f"token {token}", "Accept": "application/vnd.github.v3+json"}
-
-def load_from_gist():
-    """Load all app data from GitHub Gist."""
-    gist_id = st.secrets.get("GIST_ID", "")
+#
+# Optional — keep the data in a local SQLite file instead (only the changed
+# rows are written on each tap, instead of re-uploading everything):
+#   STORAGE_BACKEND = "sqlite"
+#   SQLITE_PATH     = "tuition_data.db"
+# If the database is empty and a gist is configured, it is imported once.
+#
+# Optional — journaled gist: each tap appends a small change record to a
+# second gist file (tuition_journal.jsonl); the full tuition_data.json is only
+# rewritten every JOURNAL_COMPACT_AFTER changes:
+#   STORAGE_BACKEND       = "journal"
+#   JOURNAL_COMPACT_AFTER = 200
+#
+# Gist saves run in the background: changes made within
+# SAVE_DEBOUNCE_SECONDS of each other (default 2) are uploaded together, and
+# nothing waits longer than SAVE_MAX_DELAY_SECONDS (default 10). Set
+# SAVE_DEBOUNCE_SECONDS = 0 to save synchronously on every tap.
+#
+# Optional — several tutors on one deployment: give each a table of their own
+# settings. Tutors sign in with the table name and its password, and see only
+# their own dataset. Keys set in a tenant's table apply to that tenant only;
+# others fall back to the app-wide value, except GIST_ID and SQLITE_PATH, which
+# are never shared (SQLITE_PATH defaults to tuition_data_<id>.db):
+#   [tenants.asha]
+#   password     = "..."
+#   GITHUB_TOKEN = "ghp_..."
+#   GIST_ID      = "..."
+# Up to TENANT_CACHE_SIZE tutors' datasets (default 8) stay open in memory;
+# the least recently used one is closed once its changes are saved.
+
+GIST_FILENAME    = "tuition_data.json"
+JOURNAL_FILENAME = "tuition_journal.jsonl"
+
+# ── tenants ──
+def tenants():
+    return st.secrets.get("tenants", {})
+
+def tenant_secret(key, default=None, shared=True):
+    """A setting for the signed-in tenant: their own table first, then (if `shared`) the app-wide secrets."""
+    tenant_id = st.session_state.get("tenant")
+    if not tenant_id:
+        return st.secrets.get(key, default)
+    tenant = tenants().get(tenant_id, {})
+    return tenant[key] if key in tenant else st.secrets.get(key, default) if shared else default
+
+def current_gist():
+    """(GIST_ID, GITHUB_TOKEN) of the signed-in tenant, or of the app without tenants.
+
+    Only valid in the script thread. Storages keep their own pair, so their
+    background threads never depend on which session asked.
+    """
+    return tenant_secret("GIST_ID", "", shared=False), tenant_secret("GITHUB_TOKEN", "")
+
+# ── gist client ──
+# All GitHub calls go through one pooled session per process (connections and
+# TLS are reused across reruns and sessions). Network errors, 5xx answers and
+# short secondary rate limits are retried with exponential backoff and full
+# jitter. X-RateLimit-* headers are tracked: once the quota is gone, calls fail
+# fast until it resets, and when it runs low the save queue spaces out writes
+# so what's left lasts until the reset. Failures raise a GistError subclass
+# rather than looking like an empty gist.
+
+class GistError(Exception):
+    """A GitHub gist request failed. `transient` errors are worth retrying later."""
+    transient = True
+
+    def __init__(self, message, status=None, retry_after=None):
+        super().__init__(message)
+        self.status      = status
+        self.retry_after = retry_after      # seconds, when GitHub said how long to wait
+
+class GistUnavailable(GistError):
+    """GitHub could not be reached, timed out or answered with a 5xx."""
+
+class GistRateLimited(GistError):
+    """The API quota is used up; see retry_after."""
+
+class GistAuthError(GistError):
+    """The token is missing, invalid or lacks the gist scope."""
+    transient = False
+
+class GistNotFound(GistError):
+    """No gist with this GIST_ID is visible to the token."""
+    transient = False
+
+class GistRequestError(GistError):
+    """GitHub refused the request itself (e.g. 422 for an invalid payload)."""
+    transient = False
+
+class GistCorrupt(GistError):
+    """A data file in the gist exists but can't be parsed; it is never treated as empty."""
+    transient = False
+
+
+class GistClient:
+    API            = "https://api.github.com"
+    TIMEOUT        = 8
+    THROTTLE_BELOW = 0.1    # start spacing out writes under 10% of the quota
+
+    def __init__(self, token, retries=3, backoff=0.5, max_backoff=8.0):
+        self.retries     = retries
+        self.backoff     = backoff
+        self.max_backoff = max_backoff
+        self.session     = requests.Session()
+        self.session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=8))
+        self.session.headers.update({"Authorization": f"token {token}",
+                                     "Accept": "application/vnd.github.v3+json"})
+        self.limit     = None
+        self.remaining = None
+        self.reset_at  = 0.0    # epoch seconds
+        self._lock     = threading.Lock()
+
+    def request(self, method, url, **kwargs) -> requests.Response:
+        """Send one request, retrying transient failures. Raises GistError."""
+        if url.startswith("/"):
+            url = self.API + url
+        for attempt in range(self.retries + 1):
+            self._check_quota()
+            try:
+                r = self.session.request(method, url, timeout=self.TIMEOUT, **kwargs)
+            except requests.RequestException as e:
+                error = GistUnavailable(f"GitHub unreachable ({e.__class__.__name__})")
+            else:
+                self._note_limits(r)
+                error = self._error_for(r)
+                if error is None:
+                    return r
+            if not error.transient or attempt == self.retries:
+                raise error
+            if error.retry_after is not None:
+                if error.retry_after > self.max_backoff:
+                    raise error         # don't hold a rerun for a whole quota window
+                delay = error.retry_after
+            else:
+                delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+            time.sleep(delay)
+
+    def write_interval(self) -> float:
+        """Seconds to leave between writes so the remaining quota lasts until it resets."""
+        with self._lock:
+            if self.limit is None or self.remaining is None or self.remaining > self.limit * self.THROTTLE_BELOW:
+                return 0.0
+            return max(self.reset_at - time.time(), 0.0) / max(self.remaining, 1)
+
+    def _check_quota(self):
+        with self._lock:
+            wait = self.reset_at - time.time()
+            if self.remaining == 0 and wait > 0:
+                raise GistRateLimited(f"GitHub API quota used up; resets in {wait:.0f}s", 403, wait)
+
+    def _note_limits(self, r):
+        h = r.headers
+        if "X-RateLimit-Remaining" not in h:
+            return
+        with self._lock:
+            self.remaining = int(h["X-RateLimit-Remaining"])
+            self.limit     = int(h.get("X-RateLimit-Limit", self.limit or 0)) or None
+            self.reset_at  = float(h.get("X-RateLimit-Reset", self.reset_at))
+
+    def _error_for(self, r):
+        code = r.status_code
+        if code < 400:
+            return None
+        if code in (403, 429):
+            if r.headers.get("X-RateLimit-Remaining") == "0":
+                wait = max(float(r.headers.get("X-RateLimit-Reset", 0)) - time.time(), 0.0)
+                return GistRateLimited(f"GitHub API quota used up; resets in {wait:.0f}s", code, wait)
+            if "Retry-After" in r.headers:
+                return GistRateLimited("GitHub asked to slow down", code, float(r.headers["Retry-After"]))
+            return GistAuthError(f"GitHub refused access ({code}); check GITHUB_TOKEN has the gist scope", code)
+        if code == 401:
+            return GistAuthError("GitHub rejected GITHUB_TOKEN (401)", code)
+        if code == 404:
+            return GistNotFound("Gist not found (404); check GIST_ID", code)
+        if code >= 500:
+            return GistUnavailable(f"GitHub error {code}", code)
+        return GistRequestError(f"GitHub rejected the request ({code})", code)
+
+
+@st.cache_resource(max_entries=16)    # one per token; tenants may bring their own
+def _open_gist_client(token):
+    return GistClient(token)
+
+def get_gist_client(token=None) -> GistClient:
+    return _open_gist_client(current_gist()[1] if token is None else token)
+
+NOT_MODIFIED = "not-modified"     # fetch_gist_files() result for a 304
+
+def _head_version(gist):
+    history = gist.get("history") or [{}]
+    return history[0].get("version")
+
+def fetch_gist_files(etag=None, gist=None):
+    """Return (files, etag, version) for the gist (`gist` is (id, token); the current one if None).
+
+    files is the {filename: file_info} map, or NOT_MODIFIED if `etag` still
+    matches (GitHub answers 304 and doesn't count it against the rate
+    limit). version is the SHA of the gist revision that was read. All three
+    are None when no gist is configured; a failed read raises GistError.
+    """
+    gist_id, token = gist or current_gist()
+    if not gist_id:
+        return None, None, None
+    started = time.perf_counter()
+    r = get_gist_client(token).request("GET", f"/gists/{gist_id}",
+                                  headers={"If-None-Match": etag} if etag else None)
+    perf_add("gist.get", started, len(r.content))
+    if r.status_code == 304:
+        return NOT_MODIFIED, etag, None
+    gist = r.json()
+    return gist["files"], r.headers.get("ETag"), _head_version(gist)
+
+def fetch_gist_head(gist=None):
+    """Return the SHA of the gist's latest revision (a small request). Raises GistError."""
+    gist_id, token = gist or current_gist()
     if not gist_id:
+        return None
+    started = time.perf_counter()
+    r = get_gist_client(token).request("GET", f"/gists/{gist_id}/commits", params={"per_page": 1})
+    perf_add("gist.head", started, len(r.content))
+    commits = r.json()
+    return commits[0]["version"] if commits else None
+
+def patch_gist_files(files: dict, gist=None):
+    """Write the given files to the gist. A file mapped to None is deleted.
+
+    Returns the SHA of the new gist revision; a failed write raises GistError.
+    Without a configured gist it writes nothing and returns None. It may run
+    on the save queue's thread, so it never reports through st.* itself.
+    """
+    gist_id, token = gist or current_gist()
+    if not gist_id:
+        return None
+    body = to_json({"files": files})
+    started = time.perf_counter()
+    try:
+        r = get_gist_client(token).request("PATCH", f"/gists/{gist_id}", data=body,
+                                      headers={"Content-Type": "application/json"})
+    finally:
+        # a failed PATCH may still have landed, so never trust the cached copy after one
+        get_data_cache().drop(gist_id)
+    perf_add("gist.patch", started, len(body))
+    return _head_version(r.json()) or "unknown"
+
+def _file_text(info, gist=None):
+    """A gist file's full text, fetched from its raw_url when the API truncated it (over 1 MB)."""
+    if info.get("truncated") and info.get("raw_url"):
+        started = time.perf_counter()
+        r = get_gist_client(gist[1] if gist else None).request("GET", info["raw_url"])
+        perf_add("gist.raw", started, len(r.content))
+        return r.text
+    return info.get("content", "")
+
+def _read_snapshot(files, gist=None):
+    """The raw tuition_data.json document; {} only for a gist that doesn't have one yet."""
+    info = files.get(GIST_FILENAME)
+    if info is None:
         return {}
     try:
-        r = requests.get(f"https://api.github.com/gists/{gist_id}", headers=_gist_headers(), timeout=8)
-        if r.status_code == 200:
-            content = r.json()["files"].get(GIST_FILENAME, {}).get("content", "{}")
-            return json.loads(content)
-    except Exception:
-        pass
-    return {}
-
-def save_to_gist(data: dict):
+        raw = from_json(_file_text(info, gist) or "{}")
+    except ValueError as e:
+        raise GistCorrupt(f"{GIST_FILENAME} couldn't be read ({e}); nothing was loaded") from e
+    if not isinstance(raw, dict):
+        raise GistCorrupt(f"{GIST_FILENAME} isn't a data file; nothing was loaded")
+    return raw
+
+def _decode_snapshot(raw):
+    try:
+        return decode_document(raw)
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        raise GistCorrupt(f"{GIST_FILENAME} couldn't be read ({e}); nothing was loaded") from e
+
+def _parse_snapshot(files):
+    return _decode_snapshot(_read_snapshot(files))
+
+def load_from_gist(gist=None):
+    """Load all app data from GitHub Gist."""
+    gist = gist or current_gist()
+    payload, _ = load_gist_cached("gist", lambda files: _parse_gist(files, gist), gist=gist)
+    return assemble_partitions(payload, archive=True) if payload else {}
+
+def save_to_gist(data: dict, gist=None):
     """Save all app data to GitHub Gist."""
-    gist_id = st.secrets.get("GIST_ID", "")
-    if not gist_id:
-        st.warning("⚠️ Storage not configured. Data will be lost on refresh. See setup guide below.", icon="⚠️")
-        return False
+    return patch_gist_files({GIST_FILENAME: {"content": to_json(encode_document(data))}}, gist)
+
+
+# ── compact schema ──
+# Files are written in schema 2, marked {"schema": 2, ...}. Schema 1 (the
+# original layout: one dict per record, pretty-printed) is still read, and a
+# gist is rewritten in schema 2 on its first save. In memory the app always
+# works with schema-1 records; the conversion happens only here.
+#
+#   attendance   {"<student_id>": {"d": [first day, gaps...], "s": "PPAP", "t": [secs]}}
+#                days are date ordinals, stored as gaps after the first;
+#                t is the mark time in seconds from that day's midnight
+#   fees         {"<student_id>": [[month, year, amount, paid-at epoch secs], ...]}
+#   reschedules  dates as ordinals, created_at as epoch seconds
+# Timestamps keep whole seconds. student_name is dropped from attendance and
+# reschedules and re-derived from the students list on load.
+
+SCHEMA_VERSION = 2
+STATUS_CODES   = {"present": "P", "absent": "A"}
+STATUS_NAMES   = {code: name for name, code in STATUS_CODES.items()}
+_EPOCH         = datetime(1970, 1, 1)
+
+def to_json(obj) -> str:
+    started = time.perf_counter()
+    text = json.dumps(obj, separators=(",", ":"))
+    perf_add("json.encode", started, len(text))
+    return text
+
+def from_json(text):
+    started = time.perf_counter()
+    obj = json.loads(text)
+    perf_add("json.decode", started, len(text))
+    return obj
+
+def _pack_time(ts, since=_EPOCH):
+    """Whole seconds from `since` for a naive ISO timestamp; anything else is kept as-is."""
     try:
-        payload = {"files": {GIST_FILENAME: {"content": json.dumps(data, indent=2)}}}
-        r = requests.patch(f"https://api.github.com/gists/{gist_id}",
-                           headers=_gist_headers(), json=payload, timeout=8)
-        return r.status_code == 200
-    except Exception as e:
-        st.error(f"Save error: {e}")
-        return False
+        return int((datetime.fromisoformat(ts) - since).total_seconds())
+    except (TypeError, ValueError):
+        return ts
+
+def _unpack_time(value, since=_EPOCH):
+    return (since + timedelta(seconds=value)).isoformat() if isinstance(value, int) else value
+
+def _pack_date(date_str):
+    return date.fromisoformat(date_str).toordinal() if date_str else date_str
+
+def _unpack_date(value):
+    return date.fromordinal(value).isoformat() if isinstance(value, int) else value
+
+def encode_attendance(records) -> dict:
+    by_student = {}
+    for a in records:
+        by_student.setdefault(a["student_id"], []).append(a)
+    out = {}
+    for sid, recs in sorted(by_student.items()):
+        recs.sort(key=lambda a: a["date"])
+        days = [_pack_date(a["date"]) for a in recs]
+        out[str(sid)] = {
+            "d": days[:1] + [b - a for a, b in zip(days, days[1:])],
+            "s": "".join(STATUS_CODES[a["status"]] for a in recs),
+            "t": [_pack_time(a.get("timestamp"), datetime.fromordinal(d)) for a, d in zip(recs, days)],
+        }
+    return out
+
+def _unpack_mark_time(day_str, secs, day):
+    if isinstance(secs, int) and 0 <= secs < 86400:
+        # the common case, formatted directly: same-day marks
+        return f"{day_str}T{secs // 3600:02d}:{secs // 60 % 60:02d}:{secs % 60:02d}"
+    return _unpack_time(secs, datetime.fromordinal(day))
+
+def decode_attendance(columns: dict, names: dict) -> list:
+    records  = []
+    day_strs = {}       # students share most days, so format each ordinal once
+    for sid, col in columns.items():
+        sid, name = int(sid), names.get(int(sid), "")
+        for day, status, ts in zip(accumulate(col["d"]), col["s"], col["t"]):
+            day_str = day_strs.get(day) or day_strs.setdefault(day, date.fromordinal(day).isoformat())
+            records.append({
+                "student_id":   sid,
+                "student_name": name,
+                "date":         day_str,
+                "status":       STATUS_NAMES[status],
+                "timestamp":    _unpack_mark_time(day_str, ts, day),
+            })
+    return records
+
+def encode_fees(by_student: dict) -> dict:
+    return {str(sid): [[p["month"], p["year"], p["amount"], _pack_time(p.get("date"))] for p in payments]
+            for sid, payments in sorted(by_student.items()) if payments}
+
+def decode_fees(rows: dict) -> dict:
+    return {int(sid): [{"month": m, "year": y, "date": _unpack_time(ts), "amount": amount}
+                       for m, y, amount, ts in payments]
+            for sid, payments in rows.items()}
+
+def encode_reschedule(r: dict) -> dict:
+    out = {k: v for k, v in r.items() if k != "student_name"}
+    for key in ("original_date", "new_date"):
+        if key in out:
+            out[key] = _pack_date(out[key])
+    if "created_at" in out:
+        out["created_at"] = _pack_time(out["created_at"])
+    return out
+
+def decode_reschedule(r: dict, names: dict) -> dict:
+    out = dict(r, student_name=names.get(r["student_id"], ""))
+    for key in ("original_date", "new_date"):
+        if key in out:
+            out[key] = _unpack_date(out[key])
+    if "created_at" in out:
+        out["created_at"] = _unpack_time(out["created_at"])
+    return out
+
+def encode_main(data: dict, years=None) -> dict:
+    """Students and reschedules (plus `years` for the partitioned layout) in schema 2."""
+    main = {"schema": SCHEMA_VERSION}
+    if years is not None:
+        main["years"] = years
+    main["students"]    = [{k: v for k, v in s.items() if k != "fees_paid"} for s in data.get("students", [])]
+    main["reschedules"] = [encode_reschedule(r) for r in data.get("reschedules", [])]
+    return main
+
+@counted
+def encode_document(data: dict) -> dict:
+    """A whole single-file dataset (journal snapshot) in schema 2."""
+    doc = encode_main(data)
+    doc["attendance"] = encode_attendance(data.get("attendance", []))
+    doc["fees"]       = encode_fees({s["id"]: s.get("fees_paid", []) for s in data.get("students", [])})
+    if data.get("archive"):
+        doc["archive"] = [encode_reschedule(r) for r in data["archive"]]
+    return doc
+
+@counted
+def decode_document(doc: dict) -> dict:
+    """Schema-1 form of a tuition_data.json document of any schema."""
+    schema = doc.get("schema", 1)
+    if schema == 1:
+        return doc
+    if schema > SCHEMA_VERSION:
+        raise ValueError(f"{GIST_FILENAME} uses schema {schema}; update the app to read it")
+    names = {s["id"]: s["name"] for s in doc.get("students", [])}
+    fees  = decode_fees(doc.get("fees", {}))
+    data = {
+        "students":    [dict(s, fees_paid=fees.get(s["id"], [])) for s in doc.get("students", [])],
+        "reschedules": [decode_reschedule(r, names) for r in doc.get("reschedules", [])],
+    }
+    if "attendance" in doc:
+        data["attendance"] = decode_attendance(doc["attendance"], names)
+    if "archive" in doc:
+        data["archive"] = [decode_reschedule(r, names) for r in doc["archive"]]
+    if "years" in doc:
+        data["years"] = doc["years"]
+    return data
+
+def fill_names(data: dict):
+    """Re-derive the student_name that compact change records leave out."""
+    names = {s["id"]: s["name"] for s in data.get("students", [])}
+    for rec in data.get("attendance", []) + data.get("reschedules", []) + data.get("archive", []):
+        if "student_name" not in rec:
+            rec["student_name"] = names.get(rec["student_id"], "")
+
+
+# ── time partitions ──
+# The gist keeps attendance and payments in one file per year
+# (attendance_2025.json, fees_2025.json). tuition_data.json holds the
+# students, reschedules and the list of years. Sessions start with the
+# HOT_YEARS most recent years (a secret of the same name overrides it);
+# older years are parsed, or fetched when the API truncated them, only when
+# the Attendance History or the Fees year selector asks for them. A gist
+# still in the old single-file layout is read as-is (from raw_url when it's
+# over the API's 1 MB limit) and split on its first write. Deleting a
+# student rewrites every year, not only the loaded ones. Archived
+# reschedules get a file of their own, read only when something asks for
+# them (a dataset saved before that keeps them in tuition_data.json until
+# its next write).
+
+HOT_YEARS = 2
+
+def hot_years():
+    this_year = date.today().year
+    return [this_year - i for i in range(max(int(st.secrets.get("HOT_YEARS", HOT_YEARS)), 1))]
+
+def attendance_file(year): return f"attendance_{year}.json"
+def fees_file(year):       return f"fees_{year}.json"
+ARCHIVE_FILENAME = "reschedule_archive.json"
+
+def op_year(op):
+    """The partition year a change record touches, or None for tuition_data.json."""
+    if op["op"] == "attendance.put":
+        return int(op["record"]["date"][:4])
+    if op["op"] == "fee.put":
+        return op["payment"]["year"]
+    if op["op"] == "fee.delete":
+        return op["year"]
+    return None
+
+def _parse_gist(files, gist=None):
+    """Parse only tuition_data.json; partitions are parsed on demand (from `gist` if truncated)."""
+    raw = _read_snapshot(files, gist)
+    return {"main": _decode_snapshot(raw), "schema": raw.get("schema", 1), "files": files, "parts": {},
+            "gist": gist}
+
+def _is_partitioned(payload):
+    return "years" in payload["main"]
+
+def _partition(payload, name, default):
+    """Parsed contents of one partition file, memoized in the (shared) payload."""
+    parts = payload["parts"]
+    if name not in parts:
+        info = payload["files"].get(name)
+        if info is None:
+            parts[name] = default
+        else:
+            content = _file_text(info, payload.get("gist"))
+            try:
+                part = from_json(content) if content.strip() else default
+            except ValueError as e:
+                raise GistCorrupt(f"{name} couldn't be read ({e})") from e
+            if isinstance(part, dict) and "schema" in part:
+                names = {s["id"]: s["name"] for s in payload["main"].get("students", [])}
+                if "archive" in part:
+                    part = [decode_reschedule(r, names) for r in part["archive"]]
+                else:
+                    part = (decode_attendance(part["attendance"], names) if "attendance" in part
+                            else decode_fees(part["fees"]))
+            parts[name] = part
+    return parts[name]
+
+def stored_archive(payload):
+    """Archived reschedules of a partitioned payload (shared: copy before editing)."""
+    main = payload["main"]
+    return main["archive"] if "archive" in main else _partition(payload, ARCHIVE_FILENAME, [])
+
+def load_partitions(payload, years, student_ids):
+    """Session copies of the attendance and payments stored for `years`."""
+    attendance, fees = [], {}
+    for year in years:
+        attendance.extend(dict(a) for a in _partition(payload, attendance_file(year), [])
+                          if a["student_id"] in student_ids)
+        for sid, payments in _partition(payload, fees_file(year), {}).items():
+            if int(sid) in student_ids:
+                fees.setdefault(int(sid), []).extend(dict(p) for p in payments)
+    return {"attendance": attendance, "fees": fees}
+
+@counted
+def assemble_partitions(payload, years=None, archive=False):
+    """A session dataset from a gist payload, with `years` loaded (all if None).
+
+    Archived reschedules are only included when `archive` is set.
+    """
+    main = payload["main"]
+    if not _is_partitioned(payload):
+        return clone_data(main if archive else without_archive(main))
+    data = clone_data({"students": main.get("students", []), "reschedules": main.get("reschedules", []),
+                       **({"archive": stored_archive(payload)} if archive else {})})
+    all_years = sorted(main["years"])
+    loaded    = all_years if years is None else [y for y in all_years if y in years]
+    part = load_partitions(payload, loaded, {s["id"] for s in data["students"]})
+    for s in data["students"]:
+        s["fees_paid"] = part["fees"].get(s["id"], [])
+    data["attendance"]   = part["attendance"]
+    data["years"]        = all_years
+    data["loaded_years"] = sorted(set(years)) if years is not None else all_years
+    return data
+
+@counted
+def split_partitions(data, names=None):
+    """{filename: {"content": ...}} for the partitioned layout, only `names` if given."""
+    att_by_year, fees_by_year = {}, {}
+    for a in data.get("attendance", []):
+        att_by_year.setdefault(int(a["date"][:4]), []).append(a)
+    for s in data.get("students", []):
+        for p in s.get("fees_paid", []):
+            fees_by_year.setdefault(p["year"], {}).setdefault(s["id"], []).append(p)
+    loaded = data.get("loaded_years") or sorted(set(att_by_year) | set(fees_by_year))
+    years  = sorted(set(data.get("years", [])) | set(att_by_year) | set(fees_by_year))
+    files = {}
+    if names is None or GIST_FILENAME in names:
+        files[GIST_FILENAME] = {"content": to_json(encode_main(data, years))}
+    for year in sorted(set(loaded) | set(att_by_year) | set(fees_by_year)):
+        for name, part in ((attendance_file(year), {"attendance": encode_attendance(att_by_year.get(year, []))}),
+                           (fees_file(year),       {"fees": encode_fees(fees_by_year.get(year, {}))})):
+            if names is None or name in names:
+                files[name] = {"content": to_json({"schema": SCHEMA_VERSION, **part})}
+    if "archive" in data and (names is None or ARCHIVE_FILENAME in names):
+        files[ARCHIVE_FILENAME] = {"content": to_json({"schema": SCHEMA_VERSION,
+                                                       "archive": [encode_reschedule(r) for r in data["archive"]]})}
+    return files
+
+
+# ── shared data cache ──
+# Parsed gist contents are kept once per server process, so a second tab or
+# device opening the app reuses them. Within DATA_CACHE_TTL_SECONDS nothing is
+# fetched at all; after that the gist is revalidated with its ETag, which
+# costs a 304 and no JSON parse when nothing changed. Every write through
+# patch_gist_files() drops the gist's entries.
+
+class SharedDataCache:
+    """Small thread-safe LRU of parsed gist payloads with a revalidation TTL."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl         = ttl
+        self._entries    = OrderedDict()    # key → {"etag", "payload", "version", "checked_at"}
+        self._lock       = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, etag, payload, version=None):
+        with self._lock:
+            self._entries[key] = {"etag": etag, "payload": payload, "version": version,
+                                  "checked_at": time.monotonic()}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def drop(self, gist_id):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == gist_id]:
+                del self._entries[key]
+
+
+@st.cache_resource
+def _open_data_cache(max_entries, ttl):
+    return SharedDataCache(max_entries, ttl)
+
+def get_data_cache() -> SharedDataCache:
+    return _open_data_cache(int(st.secrets.get("DATA_CACHE_MAX_ENTRIES", 8)),
+                            float(st.secrets.get("DATA_CACHE_TTL_SECONDS", 30)))
+
+def load_gist_cached(kind, parse, max_age=None, gist=None):
+    """Fetch the gist through the shared cache and return (parse(files), version).
+
+    The payload is shared between sessions — callers must copy it
+    (clone_data) before editing. max_age overrides the cache TTL (0 always
+    revalidates). Returns (None, None) if no gist is configured and raises
+    GistError if it can't be read.
+    """
+    gist    = gist or current_gist()
+    gist_id = gist[0]
+    if not gist_id:
+        return None, None
+    cache = get_data_cache()
+    key   = (gist_id, kind)
+    entry = cache.get(key)
+    max_age = cache.ttl if max_age is None else max_age
+    if entry and time.monotonic() - entry["checked_at"] < max_age:
+        return entry["payload"], entry["version"]
+    files, etag, version = fetch_gist_files(entry["etag"] if entry else None, gist)
+    if files is NOT_MODIFIED and entry:
+        cache.put(key, etag, entry["payload"], entry["version"])
+        return entry["payload"], entry["version"]
+    if files is NOT_MODIFIED:      # evicted while we asked: fetch it in full
+        files, etag, version = fetch_gist_files(None, gist)
+    payload = parse(files)
+    cache.put(key, etag, payload, version)
+    return payload, version
+
+def clone_data(data: dict) -> dict:
+    """Copy a dataset deep enough that in-place edits never leak between sessions."""
+    out = {}
+    for key, value in data.items():
+        if isinstance(value, list):
+            out[key] = [
+                {f: (v.copy() if isinstance(v, (list, dict)) else v) for f, v in rec.items()}
+                if isinstance(rec, dict) else rec
+                for rec in value
+            ]
+        else:
+            out[key] = value
+    return out
+
+def without_archive(data: dict) -> dict:
+    """The working set of a stored dataset: everything but the archived reschedules."""
+    return {k: v for k, v in data.items() if k != "archive"} if "archive" in data else data
+
+
+# ── storage backends ──
+# Every mutation describes itself as a small change record ("op"), e.g.
+#   {"op": "attendance.put", "record": {...}}
+#   {"op": "fee.put",        "student_id": 3, "payment": {...}}
+#   {"op": "fee.delete",     "student_id": 3, "month": 5, "year": 2025}
+#   {"op": "student.put",    "student": {...}}
+#   {"op": "student.delete", "student_id": 3}
+#   {"op": "reschedule.put", "record": {...}}
+#   {"op": "reschedule.archive", "record": {...}}   (moves it to the archive)
+# Backends that can write incrementally use the ops; the gist backend just
+# uploads the whole document.
+
+def apply_op(data: dict, op: dict):
+    """Apply one change record to a loaded data dict, in place."""
+    kind = op["op"]
+    for key in ("students", "attendance", "reschedules"):
+        data.setdefault(key, [])
+    students = data["students"]
+    if kind == "attendance.put":
+        rec = dict(op["record"])
+        data["attendance"] = [
+            a for a in data.get("attendance", [])
+            if not (a["student_id"] == rec["student_id"] and a["date"] == rec["date"])
+        ]
+        data["attendance"].append(rec)
+    elif kind in ("fee.put", "fee.delete"):
+        student = next((s for s in students if s["id"] == op["student_id"]), None)
+        if student is None:
+            return
+        if kind == "fee.put":
+            month, year = op["payment"]["month"], op["payment"]["year"]
+        else:
+            month, year = op["month"], op["year"]
+        student["fees_paid"] = [
+            p for p in student.get("fees_paid", [])
+            if not (p["month"] == month and p["year"] == year)
+        ]
+        if kind == "fee.put":
+            student["fees_paid"].append(dict(op["payment"]))
+    elif kind == "student.put":
+        # payments travel as fee.* ops, so keep whatever the target already has
+        new = dict(op["student"])
+        for i, s in enumerate(students):
+            if s["id"] == new["id"]:
+                new["fees_paid"] = s.get("fees_paid", [])
+                students[i] = new
+                break
+        else:
+            new["fees_paid"] = list(new.get("fees_paid", []))
+            students.append(new)
+    elif kind == "reschedule.archive":
+        rid = op["record"]["id"]
+        data["reschedules"] = [r for r in data["reschedules"] if r["id"] != rid]
+        data["archive"] = [r for r in data.get("archive", []) if r["id"] != rid] + [dict(op["record"])]
+    elif kind == "student.delete":
+        sid = op["student_id"]
+        if "archive" in data:
+            data["archive"] = [r for r in data["archive"] if r["student_id"] != sid]
+        data["students"]    = [s for s in students if s["id"] != sid]
+        data["attendance"]  = [a for a in data.get("attendance", []) if a["student_id"] != sid]
+        data["reschedules"] = [r for r in data.get("reschedules", []) if r["student_id"] != sid]
+    elif kind == "reschedule.put":
+        rec = dict(op["record"])
+        reschedules = data.setdefault("reschedules", [])
+        for i, r in enumerate(reschedules):
+            if r["id"] == rec["id"]:
+                reschedules[i] = rec
+                break
+        else:
+            reschedules.append(rec)
+    else:
+        raise ValueError(f"Unknown change record: {kind}")
+
+# ── offline-first local replica ──
+# The gist backends keep their last known document in LOCAL_CACHE_DIR
+# (default .tuition_cache; set it to "" to turn this off). New sessions start
+# from that copy at once and the gist is checked in a background thread;
+# remote changes then arrive through pull_merged_changes like any other
+# device's. Changes the save queue hasn't uploaded yet sit in an outbox file
+# beside it, so they survive a restart and taps keep working while GitHub is
+# unreachable.
+
+class LocalReplica:
+    """Snapshot and outbox files for one gist, each replaced atomically."""
+
+    def __init__(self, directory, key):
+        os.makedirs(directory, exist_ok=True)
+        self.snapshot_path = os.path.join(directory, f"{key}.snapshot.json")
+        self.outbox_path   = os.path.join(directory, f"{key}.outbox.jsonl")
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _replace(path, text):
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+    def read_snapshot(self):
+        try:
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def write_snapshot(self, state: dict):
+        with self._lock:
+            self._replace(self.snapshot_path, to_json(state))
+
+    def read_outbox(self) -> list:
+        try:
+            with open(self.outbox_path, encoding="utf-8") as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except (OSError, ValueError):
+            return []
+
+    def append_outbox(self, ops):
+        with self._lock, open(self.outbox_path, "a", encoding="utf-8") as f:
+            f.write("".join(to_json(op) + "\n" for op in ops))
+
+    def write_outbox(self, ops):
+        with self._lock:
+            self._replace(self.outbox_path, "".join(to_json(op) + "\n" for op in ops))
+
+
+class Storage:
+    """Interface every storage backend implements."""
+    name = "base"
+    remote = False      # remote backends are written from the background save queue
+
+    def load(self) -> dict:
+        raise NotImplementedError
+
+    def save(self, data: dict, ops=()) -> bool:
+        """Persist `data`. `ops` are the changes made since the last save."""
+        raise NotImplementedError
+
+    def write_interval(self) -> float:
+        """Minimum seconds the save queue should leave between writes."""
+        return 0.0
+
+    def load_years(self, years) -> dict:
+        """Attendance and payments of older years that load() left out.
+
+        Returns {"attendance": [...], "fees": {student_id: [payments]}}.
+        Backends that load everything up front have nothing more to give.
+        """
+        return {"attendance": [], "fees": {}}
+
+    def load_archive(self) -> list:
+        """Reschedules moved out of the working set by expire_reschedules, read on demand."""
+        return []
+
+    def close(self):
+        """Stop background work; called when the tenant pool lets go of this storage."""
+
+
+class GistStorage(Storage):
+    """Whole document in tuition_data.json.
+
+    Saves don't upload the session's copy. The change records are applied to
+    the last known remote document (`doc`) and that is written back, so two
+    devices editing at once merge per record — by student id, (student_id,
+    date) and reschedule id — instead of the last writer overwriting the
+    other. Before each write the gist's latest revision SHA is checked; if
+    someone else wrote since, their version is fetched first and counted in
+    `merges` so open sessions know to pick it up.
+    """
+    name = "gist"
+    remote = True
+
+    def __init__(self, gist, replica=None):
+        self.gist    = gist     # (GIST_ID, GITHUB_TOKEN) this storage reads and writes
+        self.doc     = None     # last known remote document, with our writes applied
+        self.version = None     # gist revision SHA that `doc` corresponds to
+        self.applied = 0        # change records written by this process
+        self.merges  = 0        # times another writer's changes were merged in
+        self.schema  = None     # schema the remote files were last read in
+        self.replica = replica  # LocalReplica, or None to always read the gist
+        self.archive_in_main = False    # archive still inside tuition_data.json; moved on the next write
+        self.offline = None     # GistError from the last background refresh, if it failed
+        self.refreshed_at = 0.0
+        self._lock   = threading.Lock()
+        self._wake   = threading.Event()
+        self._closed = False
+        if replica is not None:
+            self._restore(replica.read_snapshot())
+            threading.Thread(target=self._refresh_loop, name="gist-refresh", daemon=True).start()
+
+    def _parse(self, files):
+        return _parse_gist(files, self.gist)
+
+    def _adopt(self, payload):
+        # the archive is only pulled in when a write changes it (_ensure_doc_archive),
+        # unless it still has to be moved out of tuition_data.json
+        self.archive_in_main = _is_partitioned(payload) and "archive" in payload["main"]
+        self.doc    = assemble_partitions(payload, hot_years(),
+                                          archive=self.archive_in_main or not _is_partitioned(payload))
+        self.schema = payload["schema"]
+
+    def _session_copy(self, payload):
+        return assemble_partitions(payload, hot_years())
+
+    def _document(self, payload):
+        return payload["main"]
+
+    def load_archive(self):
+        with self._lock:
+            if self.doc is not None and "archive" in self.doc:
+                return clone_data({"archive": self.doc["archive"]})["archive"]
+        payload, _ = load_gist_cached(self.name, self._parse, gist=self.gist)
+        return clone_data({"archive": self._stored_archive(payload)})["archive"] if payload else []
+
+    def _stored_archive(self, payload):
+        return stored_archive(payload) if _is_partitioned(payload) else payload["main"].get("archive", [])
+
+    def _ensure_doc_archive(self):
+        """Pull the archive into `doc` before a write that changes it."""
+        if "archive" not in self.doc:
+            payload, _ = load_gist_cached(self.name, self._parse, gist=self.gist)
+            self.doc["archive"] = clone_data({"archive": self._stored_archive(payload)})["archive"]
+
+    def load_years(self, years):
+        payload, _ = load_gist_cached(self.name, self._parse, gist=self.gist)
+        if payload is None or not _is_partitioned(payload):
+            return super().load_years(years)
+        return load_partitions(payload, years, {s["id"] for s in payload["main"].get("students", [])})
+
+    def _ensure_doc_years(self, years):
+        """Pull partitions a write is about to touch into `doc`."""
+        loaded  = self.doc.get("loaded_years")
+        missing = sorted(set(years) - set(loaded)) if loaded is not None else []
+        if not missing:
+            return
+        part = self.load_years(missing)
+        self.doc["attendance"].extend(part["attendance"])
+        for s in self.doc["students"]:
+            s.setdefault("fees_paid", []).extend(part["fees"].get(s["id"], []))
+        self.doc["loaded_years"] = sorted(set(loaded) | set(missing))
+
+    @counted
+    def load(self):
+        if self.replica is not None:
+            with self._lock:
+                if self.doc is None:            # dropped after a failed save; the file is still good
+                    self._restore(self.replica.read_snapshot())
+            if self.doc is not None:
+                self.request_refresh()
+                return self.merged_copy()
+        payload, version = load_gist_cached(self.name, self._parse, gist=self.gist)
+        if payload is None:
+            return {}
+        with self._lock:
+            if self.replica is not None and self.doc is None:
+                self._adopt(payload)
+                self.version = version
+                self.refreshed_at = time.monotonic()
+                self._persist()
+            if self.version is None:
+                self.version = version
+        return self._session_copy(payload)
+
+    # ── local replica ──
+    def _state(self):
+        return {"version": self.version, "schema": self.schema, "doc": encode_document(self.doc),
+                "years": self.doc.get("years"), "loaded_years": self.doc.get("loaded_years"),
+                "has_archive": "archive" in self.doc, "archive_in_main": self.archive_in_main}
+
+    def _restore(self, state):
+        if not state or not state.get("doc"):
+            return
+        self.doc = decode_document(state["doc"])
+        if state.get("years") is not None:
+            self.doc["years"], self.doc["loaded_years"] = state["years"], state["loaded_years"]
+        if state.get("has_archive"):
+            self.doc.setdefault("archive", [])      # encode_document leaves an empty one out
+        self.archive_in_main = state.get("archive_in_main", False)
+        self.version, self.schema = state["version"], state["schema"]
+
+    def _persist(self):
+        if self.replica is not None and self.doc is not None:
+            self.replica.write_snapshot(self._state())
+
+    def request_refresh(self, max_age=0.0):
+        """Ask the background thread to check the gist if `doc` is older than max_age seconds."""
+        if self.replica is not None and time.monotonic() - self.refreshed_at >= max_age:
+            self._wake.set()
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+
+    def _refresh_loop(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            if self._closed:
+                return
+            try:
+                self.refresh()
+                self.offline = None
+            except GistError as e:
+                self.offline = e
+            self.refreshed_at = time.monotonic()
+
+    def refresh(self):
+        """Bring `doc` up to the gist's latest revision without holding the lock over the network."""
+        seen = self.version
+        head = fetch_gist_head(self.gist)
+        if head is None or (self.doc is not None and head == seen):
+            return
+        payload, version = load_gist_cached(self.name, self._parse, max_age=0, gist=self.gist)
+        if payload is None:
+            return
+        with self._lock:
+            if self.version != seen:
+                return                  # a save moved `doc` on meanwhile; check again next time
+            if seen is not None and (version or head) != seen:
+                self.merges += 1
+            self._adopt(payload)
+            self.version = version or head
+            self._persist()
+
+    @counted
+    def save(self, data, ops=()):
+        if not self.gist[0]:
+            return False                        # nowhere to write; save_data warns
+        with self._lock:
+            if not ops:
+                return self._write_full(data)
+            if not self._sync_remote():
+                return False
+            try:
+                # a deleted student's marks and payments go from every year, not
+                # just the loaded ones, or a later student given the same id
+                # would inherit them
+                years = {op_year(op) for op in ops} - {None}
+                if any(op["op"] == "student.delete" for op in ops):
+                    years |= set(self.doc.get("years", []))
+                self._ensure_doc_years(years)
+                if any(op["op"] in ("reschedule.archive", "student.delete") for op in ops):
+                    self._ensure_doc_archive()
+                for op in ops:
+                    apply_op(self.doc, op)
+                version = self._write(ops)
+            except GistError:
+                self.doc = None                 # unknown state: refetch before the retry
+                raise
+            self.version  = version
+            self.applied += len(ops)
+            self._persist()
+            return True
+
+    def write_interval(self):
+        return get_gist_client(self.gist[1]).write_interval()
+
+    def merged_copy(self):
+        """A session copy of `doc`, or None before the first save."""
+        with self._lock:
+            return clone_data(without_archive(self.doc)) if self.doc is not None else None
+
+    def _sync_remote(self):
+        """Make `doc` match the gist's latest revision. Raises GistError if it can't be read."""
+        head = fetch_gist_head(self.gist)
+        if head is None:
+            return False
+        if self.doc is not None and head == self.version:
+            return True
+        payload, version = load_gist_cached(self.name, self._parse, max_age=0, gist=self.gist)
+        if payload is None:
+            return False
+        if self.version is not None and (version or head) != self.version:
+            self.merges += 1
+        self._adopt(payload)
+        self.version = version or head
+        self._persist()
+        return True
+
+    def _write(self, ops):
+        if self.doc.get("loaded_years") is None:
+            # still the old single-file layout: split everything once
+            years = sorted({int(a["date"][:4]) for a in self.doc["attendance"]}
+                           | {p["year"] for s in self.doc["students"] for p in s.get("fees_paid", [])})
+            self.doc["years"], self.doc["loaded_years"] = years, list(years)
+            return self._migrate()
+        if self.schema < SCHEMA_VERSION:
+            self._ensure_doc_years(self.doc["years"])
+            return self._migrate()
+        names = {GIST_FILENAME, ARCHIVE_FILENAME} if self.archive_in_main else set()
+        for op in ops:
+            year = op_year(op)
+            if year is None:
+                names.add(GIST_FILENAME)
+                if op["op"] in ("reschedule.archive", "student.delete"):
+                    names.add(ARCHIVE_FILENAME)
+                if op["op"] == "student.delete":
+                    names.update(n for y in self.doc["loaded_years"] for n in (attendance_file(y), fees_file(y)))
+                continue
+            names.add(attendance_file(year) if op["op"] == "attendance.put" else fees_file(year))
+            if year not in self.doc["years"]:
+                self.doc["years"] = sorted(self.doc["years"] + [year])
+                names.add(GIST_FILENAME)
+        version = patch_gist_files(split_partitions(self.doc, names), self.gist)
+        if version and ARCHIVE_FILENAME in names and "archive" in self.doc:
+            self.archive_in_main = False
+        return version
+
+    def _migrate(self):
+        """Rewrite every file in the current layout and schema."""
+        version = patch_gist_files(split_partitions(self.doc), self.gist)
+        if version:
+            self.schema = SCHEMA_VERSION
+        return version
+
+    def _write_full(self, data):
+        # keep older, unloaded years listed in tuition_data.json, and leave the
+        # archive file alone unless it still has to move out of tuition_data.json
+        if self._sync_remote():
+            data = {k: v for k, v in data.items() if k != "archive"}
+            if "archive" in self.doc:
+                data["archive"] = self.doc["archive"]
+            if self.doc.get("years"):
+                data["years"] = sorted(set(self.doc["years"]) | set(data.get("years", [])))
+        version = patch_gist_files(split_partitions(data), self.gist)
+        self.doc = None
+        if version:
+            self.version = version
+        return bool(version)
+
+
+class JournaledGistStorage(GistStorage):
+    """Gist snapshot plus an append-only journal of change records.
+
+    Each save uploads only the journal file (one JSON op per line). Once it
+    holds JOURNAL_COMPACT_AFTER ops, the snapshot is rewritten and the journal
+    deleted in the same PATCH. Concurrent writers are merged the same way as
+    in GistStorage: our ops are appended to the latest remote journal.
+    """
+    name = "journal"
+
+    def __init__(self, gist, compact_after, replica=None):
+        self.compact_after = compact_after
+        self.journal = []          # serialized ops not yet folded into the snapshot
+        super().__init__(gist, replica)
+
+    def _parse(self, files):
+        raw  = _read_snapshot(files, self.gist)
+        data = _decode_snapshot(raw)
+        journal = _file_text(files[JOURNAL_FILENAME], self.gist) if JOURNAL_FILENAME in files else ""
+        lines = [line for line in journal.splitlines() if line.strip()]
+        for n, line in enumerate(lines, 1):
+            try:
+                apply_op(data, from_json(line))
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                raise GistCorrupt(f"{JOURNAL_FILENAME} line {n} couldn't be read ({e}); nothing was loaded") from e
+        fill_names(data)
+        return data, lines, raw.get("schema", 1)
+
+    def _adopt(self, payload):
+        data, lines, self.schema = payload
+        self.doc     = clone_data(data)
+        self.journal = list(lines)
+
+    def _session_copy(self, payload):
+        return clone_data(without_archive(payload[0]))
+
+    def _document(self, payload):
+        return payload[0]
+
+    def _stored_archive(self, payload):
+        return payload[0].get("archive", [])    # the snapshot and journal carry it
+
+    def _state(self):
+        return {**super()._state(), "journal": self.journal}
+
+    def _restore(self, state):
+        super()._restore(state)
+        if state and state.get("doc"):
+            self.journal = list(state.get("journal", []))
+
+    def load_years(self, years):
+        return Storage.load_years(self, years)
+
+    def _write(self, ops):
+        for op in ops:
+            if op["op"] == "student.put":
+                # payments are journaled as their own fee.* ops
+                op = {**op, "student": {k: v for k, v in op["student"].items() if k != "fees_paid"}}
+            elif op["op"] in ("attendance.put", "reschedule.put", "reschedule.archive"):
+                op = {**op, "record": {k: v for k, v in op["record"].items() if k != "student_name"}}
+            self.journal.append(to_json(op))
+        if len(self.journal) >= self.compact_after or self.schema < SCHEMA_VERSION:
+            return self._compact(self.doc)
+        return patch_gist_files({JOURNAL_FILENAME: {"content": "\n".join(self.journal) + "\n"}}, self.gist)
+
+    def _write_full(self, data):
+        if self._sync_remote():
+            data = {**data, "archive": self.doc.get("archive", [])}
+        version = self._compact({k: v for k, v in data.items() if k not in ("years", "loaded_years")})
+        self.doc = None
+        if version:
+            self.version = version
+        return bool(version)
+
+    def _compact(self, data):
+        version = patch_gist_files({
+            GIST_FILENAME:    {"content": to_json(encode_document(data))},
+            JOURNAL_FILENAME: None,
+        }, self.gist)
+        if version:
+            self.journal = []
+            self.schema  = SCHEMA_VERSION
+        return version
+
+
+class SQLiteStorage(Storage):
+    """Local SQLite file — one row per student / payment / attendance / reschedule."""
+    name = "sqlite"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS students (
+            id          INTEGER PRIMARY KEY,
+            doc         TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS fees (
+            student_id  INTEGER NOT NULL,
+            year        INTEGER NOT NULL,
+            month       INTEGER NOT NULL,
+            doc         TEXT NOT NULL,
+            PRIMARY KEY (student_id, year, month)
+        );
+        CREATE TABLE IF NOT EXISTS attendance (
+            student_id  INTEGER NOT NULL,
+            date        TEXT NOT NULL,
+            doc         TEXT NOT NULL,
+            PRIMARY KEY (student_id, date)
+        );
+        CREATE TABLE IF NOT EXISTS reschedules (
+            id          INTEGER PRIMARY KEY,
+            student_id  INTEGER NOT NULL,
+            doc         TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS reschedule_archive (
+            id          INTEGER PRIMARY KEY,
+            student_id  INTEGER NOT NULL,
+            doc         TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, path, gist=("", "")):
+        self.path = path
+        self.gist = gist        # imported from once if the database starts empty
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(self.SCHEMA)
+        self._lock = threading.Lock()   # the connection is shared by every session
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    @counted
+    def load(self):
+        with self._lock:
+            rows = self.conn.execute("SELECT doc FROM students ORDER BY id").fetchall()
+        if not rows and self.gist[0]:
+            # first run on a fresh database: import the existing gist once
+            data = load_from_gist(self.gist)
+            if data:
+                self.save(data)
+            return data
+
+        # like the gist, start with the recent years only (see load_years)
+        first_year = min(hot_years())
+        with self._lock:
+            students = [json.loads(doc) for (doc,) in rows]
+            by_id = {s["id"]: s for s in students}
+            for s in students:
+                s["fees_paid"] = []
+            for sid, doc in self.conn.execute(
+                    "SELECT student_id, doc FROM fees WHERE year >= ? ORDER BY rowid", (first_year,)):
+                if sid in by_id:
+                    by_id[sid]["fees_paid"].append(json.loads(doc))
+            years = sorted(y for (y,) in self.conn.execute(
+                "SELECT DISTINCT CAST(substr(date, 1, 4) AS INTEGER) FROM attendance "
+                "UNION SELECT DISTINCT year FROM fees"))
+            return {
+                "students":     students,
+                "attendance":   [json.loads(doc) for (doc,) in self.conn.execute(
+                                 "SELECT doc FROM attendance WHERE date >= ? ORDER BY rowid",
+                                 (f"{first_year}-01-01",))],
+                "reschedules":  [json.loads(doc) for (doc,) in
+                                 self.conn.execute("SELECT doc FROM reschedules ORDER BY rowid")],
+                "years":        years,
+                "loaded_years": sorted(set(hot_years()) | {y for y in years if y >= first_year}),
+            }
+
+    @counted
+    def load_years(self, years):
+        years = list(years)
+        marks = ", ".join("?" * len(years))
+        fees = {}
+        with self._lock:
+            for sid, doc in self.conn.execute(
+                    f"SELECT student_id, doc FROM fees WHERE year IN ({marks}) ORDER BY rowid", years):
+                fees.setdefault(sid, []).append(json.loads(doc))
+            attendance = [json.loads(doc) for (doc,) in self.conn.execute(
+                f"SELECT doc FROM attendance WHERE CAST(substr(date, 1, 4) AS INTEGER) IN ({marks}) "
+                "ORDER BY rowid", years)]
+        return {"attendance": attendance, "fees": fees}
+
+    def load_archive(self):
+        with self._lock:
+            return [json.loads(doc) for (doc,) in
+                    self.conn.execute("SELECT doc FROM reschedule_archive ORDER BY rowid")]
+
+    @counted
+    def save(self, data, ops=()):
+        try:
+            with self._lock, self.conn:
+                if ops:
+                    for op in ops:
+                        self._apply(op)
+                else:
+                    self._replace_all(data)
+            return True
+        except sqlite3.Error as e:
+            st.error(f"Save error: {e}")
+            return False
+
+    def _put_student(self, student):
+        doc = {k: v for k, v in student.items() if k != "fees_paid"}
+        self.conn.execute("INSERT OR REPLACE INTO students (id, doc) VALUES (?, ?)",
+                          (student["id"], json.dumps(doc)))
+
+    def _put_fee(self, student_id, payment):
+        self.conn.execute("INSERT OR REPLACE INTO fees (student_id, year, month, doc) VALUES (?, ?, ?, ?)",
+                          (student_id, payment["year"], payment["month"], json.dumps(payment)))
+
+    def _put_attendance(self, rec):
+        self.conn.execute("INSERT OR REPLACE INTO attendance (student_id, date, doc) VALUES (?, ?, ?)",
+                          (rec["student_id"], rec["date"], json.dumps(rec)))
+
+    def _put_reschedule(self, rec, table="reschedules"):
+        self.conn.execute(f"INSERT OR REPLACE INTO {table} (id, student_id, doc) VALUES (?, ?, ?)",
+                          (rec["id"], rec["student_id"], json.dumps(rec)))
+
+    def _apply(self, op):
+        kind = op["op"]
+        if kind == "attendance.put":
+            self._put_attendance(op["record"])
+        elif kind == "fee.put":
+            self._put_fee(op["student_id"], op["payment"])
+        elif kind == "fee.delete":
+            self.conn.execute("DELETE FROM fees WHERE student_id = ? AND year = ? AND month = ?",
+                              (op["student_id"], op["year"], op["month"]))
+        elif kind == "student.put":
+            self._put_student(op["student"])
+        elif kind == "student.delete":
+            for table in ("fees", "attendance", "reschedules", "reschedule_archive"):
+                self.conn.execute(f"DELETE FROM {table} WHERE student_id = ?", (op["student_id"],))
+            self.conn.execute("DELETE FROM students WHERE id = ?", (op["student_id"],))
+        elif kind == "reschedule.put":
+            self._put_reschedule(op["record"])
+        elif kind == "reschedule.archive":
+            self.conn.execute("DELETE FROM reschedules WHERE id = ?", (op["record"]["id"],))
+            self._put_reschedule(op["record"], "reschedule_archive")
+        else:
+            raise ValueError(f"Unknown change record: {kind}")
+
+    def _replace_all(self, data):
+        for table in ("students", "fees", "attendance", "reschedules"):
+            self.conn.execute(f"DELETE FROM {table}")
+        for s in data.get("students", []):
+            self._put_student(s)
+            for p in s.get("fees_paid", []):
+                self._put_fee(s["id"], p)
+        for a in data.get("attendance", []):
+            self._put_attendance(a)
+        for r in data.get("reschedules", []):
+            self._put_reschedule(r)
+        if "archive" in data:
+            self.conn.execute("DELETE FROM reschedule_archive")
+            for r in data["archive"]:
+                self._put_reschedule(r, "reschedule_archive")
+
+
+def _open_storage(backend, sqlite_path, compact_after, cache_dir, gist):
+    if backend == "sqlite":
+        return SQLiteStorage(sqlite_path, gist)
+    replica = LocalReplica(cache_dir, f"{backend}-{gist[0]}") if cache_dir and gist[0] else None
+    if backend == "journal":
+        return JournaledGistStorage(gist, compact_after, replica)
+    return GistStorage(gist, replica)
+
+def _storage_config():
+    tenant_id = st.session_state.get("tenant")
+    return (tenant_secret("STORAGE_BACKEND", "gist"),
+            tenant_secret("SQLITE_PATH", f"tuition_data_{tenant_id}.db", shared=False) if tenant_id
+            else st.secrets.get("SQLITE_PATH", "tuition_data.db"),
+            int(tenant_secret("JOURNAL_COMPACT_AFTER", 200)),
+            st.secrets.get("LOCAL_CACHE_DIR", ".tuition_cache"),
+            current_gist())
+
+def get_storage() -> Storage:
+    return get_tenant_pool().storage(_storage_config())
+
+
+# ── write-behind save queue ──
+# Taps only hand their changes to the queue; a background thread uploads
+# them once no new change has arrived for SAVE_DEBOUNCE_SECONDS (or at the
+# latest SAVE_MAX_DELAY_SECONDS after the first pending change), so taking
+# roll for a whole batch costs one network write.
+
+class SaveQueue:
+    """Coalesces saves into one background write per burst of taps."""
+    RETRY_AFTER = 30    # seconds to wait before retrying a failed write
+
+    def __init__(self, storage: Storage, debounce: float, max_delay: float):
+        self.storage   = storage
+        self.debounce  = debounce
+        self.max_delay = max_delay
+        self._lock       = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake       = threading.Event()
+        self._data     = None      # latest full snapshot waiting to be written
+        self._ops      = []        # change records since the last successful write
+        self._first_at = None
+        self._last_at  = None
+        self._retry_at = 0.0
+        self._written_at = 0.0
+        self.saving    = False
+        self.error     = None
+        self.synced_at = None
+        self._inflight = []        # change records being written right now
+        self.replica   = getattr(storage, "replica", None)
+        if self.replica is not None:
+            # changes a previous run accepted but never uploaded
+            self._ops = self.replica.read_outbox()
+            if self._ops:
+                self._data = {}
+                self._first_at = self._last_at = time.monotonic()
+                self._wake.set()
+        self._closed   = False
+        threading.Thread(target=self._run, name="save-queue", daemon=True).start()
+        atexit.register(self.flush)
+
+    def submit(self, data: dict, ops=()):
+        # copy on the caller's thread: the session keeps editing these records
+        # in place (attendance upserts, fees_paid appends) while the writer
+        # serialises them. With ops the storage writes only those, so the
+        # dataset itself is needed just for a full save.
+        snapshot = {} if ops else clone_data(data)
+        ops = copy.deepcopy(list(ops))
+        with self._lock:
+            now = time.monotonic()
+            self._data = snapshot
+            self._ops.extend(ops)
+            if self.replica is not None and ops:
+                self.replica.append_outbox(ops)
+            self._first_at = self._first_at or now
+            self._last_at  = now
+        self._wake.set()
+
+    @property
+    def pending(self):
+        return len(self._ops) if self._data is not None else 0
+
+    def pending_ops(self):
+        """Change records accepted but not yet written, oldest first."""
+        with self._lock:
+            return self._inflight + self._ops
+
+    def status(self):
+        if self.saving:
+            return "saving"
+        if self._data is not None:
+            return "error" if self.error else "pending"
+        return "synced"
+
+    def _due(self):
+        # the storage may ask for writes to be spaced out (gist rate limit)
+        spacing = self.storage.write_interval()
+        return max(min(self._last_at + self.debounce, self._first_at + self.max_delay),
+                   self._retry_at, self._written_at + spacing)
+
+    def close(self):
+        """Upload whatever is left and stop the writer thread. Returns False if that write failed."""
+        self._closed = True
+        self._wake.set()
+        atexit.unregister(self.flush)
+        return self.flush()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            if self._closed:
+                return
+            with self._lock:
+                if self._data is None:
+                    self._wake.clear()
+                    continue
+                delay = self._due() - time.monotonic()
+            if delay > 0:
+                time.sleep(min(delay, self.debounce or delay))
+                continue
+            self.flush()
+
+    def flush(self):
+        """Write whatever is pending now. Returns False if the write failed."""
+        with self._flush_lock:
+            with self._lock:
+                data, ops = self._data, self._ops
+                if data is None:
+                    return True
+                self._data, self._ops = None, []
+                self._inflight = ops
+                self._first_at = self._last_at = None
+            self.saving = True
+            retry_after = self.RETRY_AFTER
+            try:
+                ok = self.storage.save(data, ops)
+            except Exception as e:
+                ok, self.error = False, str(e)
+                if getattr(e, "retry_after", None):
+                    retry_after = max(e.retry_after, 1.0)
+            self.saving = False
+            self._written_at = time.monotonic()
+            if ok:
+                self.error, self.synced_at = None, datetime.now()
+                with self._lock:
+                    self._inflight = []
+                    if self.replica is not None:
+                        self.replica.write_outbox(self._ops)
+                return True
+            with self._lock:
+                # put the failed batch back in front of anything newer
+                self._inflight = []
+                now = time.monotonic()
+                self._data = self._data or data
+                self._ops  = ops + self._ops
+                self._first_at = self._last_at = now
+                self._retry_at = now + retry_after
+                self.error = self.error or "Could not reach storage"
+            self._wake.set()
+            return False
+
+
+def get_save_queue() -> SaveQueue:
+    return get_tenant_pool().queue(_storage_config(),
+                                   float(st.secrets.get("SAVE_DEBOUNCE_SECONDS", 2)),
+                                   float(st.secrets.get("SAVE_MAX_DELAY_SECONDS", 10)))
+
+
+# ── tenant pool ──
+# Every dataset (one per tenant, or the only one without tenants) gets one
+# storage and, for the gist backends, one save queue, shared by all of its
+# sessions. Datasets are kept in an LRU of TENANT_CACHE_SIZE entries, so one
+# process can serve many tutors without holding all of them in memory; a
+# tutor who comes back within that window skips the reload. Only datasets
+# whose queue has nothing left to upload are closed, so the pool may run over
+# its size for a moment rather than drop unsaved changes.
+
+class TenantPool:
+    """Bounded LRU of open storages and their save queues, keyed by storage config."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries    = OrderedDict()    # config → {"storage", "queue"}
+        self._lock       = threading.Lock()
+
+    def _entry(self, config):
+        with self._lock:
+            entry = self._entries.get(config)
+            if entry is not None:
+                self._entries.move_to_end(config)
+                return entry
+            entry = self._entries[config] = {"storage": _open_storage(*config), "queue": None}
+            idle = [key for key, e in self._entries.items()
+                    if key != config and (e["queue"] is None or e["queue"].status() == "synced")]
+            evicted = [self._entries.pop(key) for key in idle[:len(self._entries) - self.max_entries]]
+        for e in evicted:
+            if e["queue"] is not None:
+                e["queue"].close()
+            e["storage"].close()
+        return entry
+
+    def storage(self, config) -> Storage:
+        return self._entry(config)["storage"]
+
+    def queue(self, config, debounce, max_delay) -> SaveQueue:
+        entry = self._entry(config)
+        with self._lock:
+            if entry["queue"] is None:
+                entry["queue"] = SaveQueue(entry["storage"], debounce, max_delay)
+            return entry["queue"]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+@st.cache_resource
+def _open_tenant_pool(max_entries):
+    return TenantPool(max_entries)
+
+def get_tenant_pool() -> TenantPool:
+    return _open_tenant_pool(max(int(st.secrets.get("TENANT_CACHE_SIZE", 8)), 1))
 
 def get_all_data():
     return {
@@ -143,30 +1856,169 @@ def get_all_data():
         "reschedules": st.session_state.reschedules,
     }
 
-def save_data():
-    save_to_gist(get_all_data())
+def _queue_saves(storage):
+    # without a gist there is nothing to upload, so save inline and let it warn
+    return (storage.remote and bool(storage.gist[0])
+            and float(st.secrets.get("SAVE_DEBOUNCE_SECONDS", 2)) > 0)
+
+def _invalidate_indexes(ops):
+    # student / reschedule edits happen in place, so drop the derived schedule
+    if not ops or any(op["op"].startswith(("student.", "reschedule.")) for op in ops):
+        st.session_state.pop("schedule_index", None)
+
+@counted
+def save_data(*ops):
+    """Persist the current data. Pass the change records describing the mutation."""
+    _invalidate_indexes(ops)
+    st.session_state.own_ops = st.session_state.get("own_ops", 0) + len(ops)
+    storage = get_storage()
+    if _queue_saves(storage):
+        get_save_queue().submit(get_all_data(), ops)
+        return
+    try:
+        if not storage.save(get_all_data(), ops) and storage.remote and not storage.gist[0]:
+            st.warning("⚠️ Storage not configured. Data will be lost on refresh. See setup guide below.", icon="⚠️")
+    except GistError as e:
+        st.error(f"⚠️ Not saved: {e}")
+
+def pull_merged_changes():
+    """Adopt the storage's merged copy if other sessions or devices wrote since we loaded.
+
+    Our own changes are already in that copy once the save queue is idle, so
+    it only needs swapping in when the write counters moved by more than this
+    session's own change records.
+    """
+    storage = get_storage()
+    if not isinstance(storage, GistStorage):
+        return
+    storage.request_refresh(float(st.secrets.get("REMOTE_REFRESH_SECONDS", 60)))
+    if _queue_saves(storage) and get_save_queue().status() != "synced":
+        return
+    if storage.doc is None:
+        return
+    applied, merges = storage.applied, storage.merges
+    seen_applied, seen_merges = st.session_state.get("seen_writes", (applied, merges))
+    foreign = merges != seen_merges or applied - seen_applied != st.session_state.get("own_ops", 0)
+    data = storage.merged_copy() if foreign else None
+    st.session_state.seen_writes = (applied, merges)
+    st.session_state.own_ops     = 0
+    if data is not None:
+        st.session_state.students     = data.get("students",   [])
+        st.session_state.attendance   = data.get("attendance", [])
+        st.session_state.reschedules  = data.get("reschedules",[])
+        st.session_state.years        = data.get("years", [])
+        st.session_state.loaded_years = set(data["loaded_years"]) if "loaded_years" in data else None
+        st.toast("🔄 Picked up changes made on another device")
+
+def ensure_years_loaded(years):
+    """Pull older attendance / payment partitions into this session on first use."""
+    loaded = st.session_state.get("loaded_years")
+    if loaded is None:
+        return
+    missing = sorted(set(years) - loaded)
+    if not missing:
+        return
+    stored = [y for y in missing if y in st.session_state.get("years", [])]
+    if stored:
+        try:
+            part = get_storage().load_years(stored)
+        except GistError as e:
+            st.error(f"⚠️ Couldn't load {', '.join(map(str, stored))}: {e}")
+            return
+        st.session_state.attendance.extend(part["attendance"])
+        for s in st.session_state.students:
+            s.setdefault("fees_paid", []).extend(part["fees"].get(s["id"], []))
+        st.session_state.pop("attendance_index", None)
+        st.session_state.pop("attendance_frame", None)
+        st.session_state.pop("fee_ledger", None)
+    st.session_state.loaded_years = loaded | set(missing)
+
+def unloaded_years():
+    loaded = st.session_state.get("loaded_years")
+    if loaded is None:
+        return []
+    return [y for y in st.session_state.get("years", []) if y not in loaded]
+
+def render_sync_status():
+    if not _queue_saves(get_storage()):
+        return
+    offline = getattr(get_storage(), "offline", None)
+    if offline:
+        st.caption(f"📴 Offline ({offline}) — showing the copy saved on this device")
+    queue = get_save_queue()
+    status = queue.status()
+    if status == "synced":
+        st.caption("🟢 All changes saved")
+    elif status == "saving":
+        st.caption("🔄 Saving…")
+    elif status == "pending":
+        st.caption(f"🟠 {queue.pending} change(s) pending upload")
+    else:
+        st.caption(f"🔴 {queue.pending} change(s) not saved yet ({queue.error}) — will retry")
+
 
+perf_section("setup")
+
+# ─────────────────────────────────────────────
+# SIGN IN (only with [tenants.*] in secrets)
+# ─────────────────────────────────────────────
+if tenants() and st.session_state.get("tenant") not in tenants():
+    st.markdown("## 📚 Tuition Tracker")
+    with st.form("sign_in"):
+        tenant_id = st.text_input("Tutor ID").strip()
+        password  = st.text_input("Password", type="password")
+        signed_in = st.form_submit_button("Sign in", type="primary", use_container_width=True)
+    if signed_in:
+        expected = str(tenants().get(tenant_id, {}).get("password", ""))
+        if expected and hmac.compare_digest(password.encode(), expected.encode()):
+            st.session_state.tenant = tenant_id
+            st.rerun()
+        st.error("Unknown tutor ID or wrong password.")
+    st.stop()
 
 # ─────────────────────────────────────────────
 # SESSION STATE INIT
 # ─────────────────────────────────────────────
 if "data_loaded" not in st.session_state:
-    data = load_from_gist()
+    try:
+        data = get_storage().load()
+    except GistError as e:
+        # never carry on with an empty dataset: the next save would be built on it
+        st.error(f"⚠️ Couldn't load your data: {e}")
+        if e.transient:
+            st.button("🔄 Try again", type="primary", use_container_width=True)
+        st.stop()
+    pending = get_save_queue().pending_ops() if _queue_saves(get_storage()) else []
+    for op in pending:              # queued writes aren't in the loaded copy yet
+        apply_op(data, op)
     st.session_state.students   = data.get("students",   [])
     st.session_state.attendance = data.get("attendance", [])
     st.session_state.reschedules= data.get("reschedules",[])
+    st.session_state.years        = data.get("years", [])
+    st.session_state.loaded_years = set(data["loaded_years"]) if "loaded_years" in data else None
     st.session_state.data_loaded = True
+    st.session_state.own_ops     = len(pending)
+    st.session_state.seen_writes = (getattr(get_storage(), "applied", 0), getattr(get_storage(), "merges", 0))
+else:
+    pull_merged_changes()
 
 if "page"          not in st.session_state: st.session_state.page = "home"
 if "selected_days" not in st.session_state: st.session_state.selected_days = {}
 if "edit_student"  not in st.session_state: st.session_state.edit_student = None
 if "confirm_delete"not in st.session_state: st.session_state.confirm_delete = None
+if "open_student"  not in st.session_state: st.session_state.open_student = None
+if "students_page" not in st.session_state: st.session_state.students_page = 0
+if "students_page_size" not in st.session_state:
+    st.session_state.students_page_size = int(st.secrets.get("STUDENTS_PAGE_SIZE", 20))
+
+perf_section("session")
 
 
 # ─────────────────────────────────────────────
 # HELPER FUNCTIONS
 # ─────────────────────────────────────────────
 DAY_NAMES = ['Monday','Tuesday','Wednesday','Thursday','Friday','Saturday','Sunday']
+STUDENTS_PAGE_SIZES = [10, 20, 50, 100]
 
 def get_time_for_day(student, day_name):
     ts = student.get("time_slot", {})
@@ -174,73 +2026,894 @@ def get_time_for_day(student, day_name):
         return ts.get(day_name, "—")
     return student.get("time_slot", "—")
 
+# ── time slots ──
+# Slots are stored as text in one standard form ("4:00 PM – 5:00 PM"); each
+# distinct string is parsed once into minutes since midnight. Older free-text
+# slots are rewritten in that form the first time a session loads them.
+
+SLOT_RE = re.compile(r"^\s*(\d{1,2})(?:[:.](\d{2}))?(?:\s*([ap])\.?\s*m\.?)?\s*(?:-|–|—|to)"
+                     r"\s*(\d{1,2})(?:[:.](\d{2}))?(?:\s*([ap])\.?\s*m\.?)?\s*$", re.IGNORECASE)
+NO_SLOT  = 24 * 60      # sorts unparsed slots after every real one
+MORNING  = range(8, 12) # bare "9-10" starts in the morning; "4-5" or "7-8" in the afternoon / evening
+
+def _minutes(hour, minute, half):
+    hour, minute = int(hour), int(minute or 0)
+    if minute > 59 or hour > 23 or (half and not 1 <= hour <= 12):
+        raise ValueError
+    if half:
+        hour = hour % 12 + (12 if half.lower() == "p" else 0)
+    return hour * 60 + minute
+
+def _is_bare(groups):
+    # "4-5" or "4:00-5:00": 12-hour times with no AM/PM on either side
+    h1, _, half1, h2, _, half2 = groups
+    return not (half1 or half2) and 1 <= int(h1) <= 12 and 1 <= int(h2) <= 12
+
+@functools.lru_cache(maxsize=1024)
+def parse_slot(text):
+    """(start, end) in minutes since midnight for text like "4:00 PM – 5:00 PM" or "16:00-17:00", else None.
+
+    Bare 12-hour slots such as "4-5" take AM/PM from teaching hours: a start
+    in MORNING is AM, anything else PM (12 is noon), and the end is the first
+    matching time after the start. See normalize_slot.
+    """
+    m = SLOT_RE.match(text or "")
+    if not m:
+        return None
+    h1, m1, half1, h2, m2, half2 = m.groups()
+    if _is_bare(m.groups()):
+        start = _minutes(h1, m1, "a" if int(h1) in MORNING else "p")
+        end   = _minutes(h2, m2, "a")
+        if end <= start:
+            end += 12 * 60                      # "11-12", "10:30-1", "4-5"
+        return (start, end) if start < end < 24 * 60 else None
+    try:
+        end   = _minutes(h2, m2, half2)
+        start = _minutes(h1, m1, half1 or half2)
+        if half2 and not half1 and start >= end:
+            start = _minutes(h1, m1, "a")       # "11:30 – 12:30 PM"
+    except ValueError:
+        return None
+    return (start, end) if start < end else None
+
+def _clock(minutes):
+    hour, minute = divmod(minutes, 60)
+    return f"{(hour - 1) % 12 + 1}:{minute:02d} {'AM' if hour < 12 else 'PM'}"
+
+def normalize_slot(text):
+    """The standard spelling of a slot, or the text unchanged if it isn't one.
+
+    Bare 12-hour slots are left as they are: the teaching-hours reading is
+    fine for ordering and clash checks, but it is only a guess and isn't
+    written back.
+    """
+    m = SLOT_RE.match(text or "")
+    slot = parse_slot(text)
+    if not slot or _is_bare(m.groups()):
+        return text
+    return f"{_clock(slot[0])} – {_clock(slot[1])}"
+
+def slot_start(text):
+    slot = parse_slot(text)
+    return slot[0] if slot else NO_SLOT
+
+def slots_overlap(a, b):
+    a, b = parse_slot(a), parse_slot(b)
+    return bool(a and b) and a[0] < b[1] and b[0] < a[1]
+
+def migrate_time_slots(students, reschedules):
+    """Rewrite slots in the standard form, in place. Returns the change records to save."""
+    ops = []
+    for s in students:
+        ts = s.get("time_slot")
+        if isinstance(ts, dict) and any(normalize_slot(t) != t for t in ts.values()):
+            s["time_slot"] = {day: normalize_slot(t) for day, t in ts.items()}
+            ops.append({"op": "student.put", "student": s})
+    for r in reschedules:
+        if normalize_slot(r.get("new_time")) != r.get("new_time"):
+            r["new_time"] = normalize_slot(r["new_time"])
+            ops.append({"op": "reschedule.put", "record": r})
+    return ops
+
+class ScheduleIndex:
+    """Weekday → students and date → active reschedules, built in one pass.
+
+    Rebuilt whenever a student or reschedule changes (see save_data), so
+    looking up a day is a couple of dict accesses. Each weekday's students are
+    kept in class-time order, alongside an interval index for clash checks:
+    slots sorted by start with a running maximum of their ends, so the slots
+    overlapping a new one are found by a bisect and a short walk back.
+    """
+
+    def __init__(self, students: list, reschedules: list):
+        self.students    = students
+        self.reschedules = reschedules
+        self.by_id       = {s["id"]: s for s in students}
+        self.by_weekday  = {day: [] for day in DAY_NAMES}
+        self.moved_away  = {}     # original_date → {student_id}
+        self.moved_in    = {}     # new_date → {student_id: reschedule}
+        self.intervals   = {}     # weekday → [(start, end, student_id)] by start
+        self.reach       = {}     # weekday → running max of the ends above
+        for s in students:
+            ts = s.get("time_slot", {})
+            for day in (ts.keys() if isinstance(ts, dict) else s.get("days", [])):
+                self.by_weekday.setdefault(day, []).append(s)
+                slot = parse_slot(get_time_for_day(s, day))
+                if slot:
+                    self.intervals.setdefault(day, []).append((*slot, s["id"]))
+        for day, members in self.by_weekday.items():
+            members.sort(key=lambda s: (slot_start(get_time_for_day(s, day)), s["name"]))
+        for day, spans in self.intervals.items():
+            spans.sort()
+            self.reach[day] = list(accumulate((end for _, end, _ in spans), max))
+        for r in reschedules:
+            if r["status"] != "active":
+                continue
+            self.moved_away.setdefault(r["original_date"], set()).add(r["student_id"])
+            self.moved_in.setdefault(r["new_date"], {}).setdefault(r["student_id"], r)
+
+    def clashes(self, day_name, slot_text, exclude=None, date_str=None):
+        """Students whose class overlaps slot_text on day_name (or on the date date_str): [(student, time)]."""
+        slot = parse_slot(slot_text)
+        if not slot:
+            return []
+        start, end = slot
+        spans, reach = self.intervals.get(day_name, []), self.reach.get(day_name, [])
+        away  = self.moved_away.get(date_str, ()) if date_str else ()
+        found = []
+        # every span from j down has start < end; stop once none of them reaches past start
+        j = bisect.bisect_left(spans, (end,)) - 1
+        while j >= 0 and reach[j] > start:
+            s_start, s_end, sid = spans[j]
+            if s_end > start and sid != exclude and sid not in away:
+                found.append((self.by_id[sid], get_time_for_day(self.by_id[sid], day_name)))
+            j -= 1
+        for sid, r in (self.moved_in.get(date_str, {}) if date_str else {}).items():
+            if sid != exclude and sid in self.by_id and slots_overlap(r.get("new_time"), slot_text):
+                found = [f for f in found if f[0]["id"] != sid] + [(self.by_id[sid], r["new_time"])]
+        return sorted(found, key=lambda f: slot_start(f[1]))
+
+    def students_for(self, day_name, date_str=None):
+        base = self.by_weekday.get(day_name, [])
+        if date_str is None:
+            return list(base)
+        away = self.moved_away.get(date_str, ())
+        result = [s for s in base if s["id"] not in away]
+        seen  = {s["id"] for s in result}
+        moved = self.moved_in.get(date_str, {})
+        for sid in moved:
+            s = self.by_id.get(sid)
+            if s and sid not in seen:
+                result.append(s)
+        if moved:
+            result.sort(key=lambda s: slot_start(moved[s["id"]]["new_time"] if s["id"] in moved
+                                                 else get_time_for_day(s, day_name)))
+        return result
+
+    def reschedule_to(self, student_id, date_str):
+        """The active reschedule bringing student_id to date_str, if any."""
+        return self.moved_in.get(date_str, {}).get(student_id)
+
+    def occurrences(self, start, end):
+        """Every class from start to end (inclusive): {date: [(student, time, reschedule)]}.
+
+        Each weekday's classes are expanded once and shared by every date
+        falling on it; only dates a reschedule moves a class off or onto get
+        their own list.
+        """
+        weekly = [[(s, get_time_for_day(s, day), None) for s in self.by_weekday.get(day, [])]
+                  for day in DAY_NAMES]
+        out = {}
+        for n in range((end - start).days + 1):
+            day     = start + timedelta(days=n)
+            day_str = day.isoformat()
+            classes = weekly[day.weekday()]
+            away    = self.moved_away.get(day_str)
+            moved   = self.moved_in.get(day_str)
+            if away or moved:
+                classes = [c for c in classes if c[0]["id"] not in (away or ())]
+                seen = {c[0]["id"] for c in classes}
+                for sid, r in (moved or {}).items():
+                    if sid in self.by_id and sid not in seen:
+                        classes.append((self.by_id[sid], r.get("new_time", "—"), r))
+                classes.sort(key=lambda c: slot_start(c[1]))
+            if classes:
+                out[day] = classes
+        return out
+
+
+def get_schedule_index() -> ScheduleIndex:
+    idx = st.session_state.get("schedule_index")
+    if (idx is None or idx.students is not st.session_state.students
+            or idx.reschedules is not st.session_state.reschedules):
+        idx = st.session_state.schedule_index = ScheduleIndex(st.session_state.students,
+                                                              st.session_state.reschedules)
+    return idx
+
+@counted
 def get_students_for_day(day_name, check_date=None):
     """Return students scheduled on day_name, accounting for reschedules."""
-    base = []
-    for s in st.session_state.students:
-        ts = s.get("time_slot", {})
-        days = list(ts.keys()) if isinstance(ts, dict) else s.get("days", [])
-        if day_name in days:
-            base.append(s)
-
-    if check_date:
-        date_str = str(check_date)
-        rescheduled_away = {
-            r["student_id"]
-            for r in st.session_state.reschedules
-            if r["original_date"] == date_str and r["status"] == "active"
+    return get_schedule_index().students_for(day_name, str(check_date) if check_date else None)
+
+@counted
+def class_counts(start, end):
+    """Per student and month: scheduled classes, those held by today, and present / absent marks.
+
+    {student_id: {(year, month): {"scheduled", "held", "present", "absent"}}}
+    """
+    today  = date.today()
+    counts = {}
+    blank  = lambda: {"scheduled": 0, "held": 0, "present": 0, "absent": 0}
+    for day, classes in get_schedule_index().occurrences(start, end).items():
+        for student, _, _ in classes:
+            c = counts.setdefault(student["id"], {}).setdefault((day.year, day.month), blank())
+            c["scheduled"] += 1
+            c["held"]      += day <= today
+    first, last = start.isoformat(), end.isoformat()
+    by_month = get_attendance_index().by_month
+    months   = [(y, m) for y in range(start.year, end.year + 1) for m in range(1, 13)
+                if (start.year, start.month) <= (y, m) <= (end.year, end.month)]
+    for month in months:
+        for (sid, date_str), rec in by_month.get(month, {}).items():
+            if first <= date_str <= last:
+                counts.setdefault(sid, {}).setdefault(month, blank())[rec["status"]] += 1
+    return counts
+
+class FeeLedger:
+    """(month, year) → {student_id: payment} over every student's fees_paid.
+
+    Updated on pay / unpay, so a month's status for all students is one
+    dict lookup instead of a scan of each student's payment history.
+    """
+
+    def __init__(self, students: list):
+        self.students = students
+        self.by_month = {}
+        for s in students:
+            for p in s.get("fees_paid", []):
+                self.by_month.setdefault((p["month"], p["year"]), {}).setdefault(s["id"], p)
+
+    def payment(self, student_id, month, year):
+        return self.by_month.get((month, year), {}).get(student_id)
+
+    def pay(self, student, month, year):
+        payment = {
+            "month":  month,
+            "year":   year,
+            "date":   datetime.now().isoformat(),
+            "amount": student["monthly_fee"]
         }
-        base = [s for s in base if s["id"] not in rescheduled_away]
+        student.setdefault("fees_paid", []).append(payment)
+        self.by_month.setdefault((month, year), {})[student["id"]] = payment
+        return payment
+
+    def unpay(self, student, month, year):
+        student["fees_paid"] = [
+            p for p in student.get("fees_paid", [])
+            if not (p["month"] == month and p["year"] == year)
+        ]
+        self.by_month.get((month, year), {}).pop(student["id"], None)
+
+    def summary(self, month, year):
+        """Expected / received / pending totals plus the paid and unpaid lists, in one pass."""
+        paid_ids = self.by_month.get((month, year), {})
+        expected = received = 0.0
+        paid, unpaid = [], []
+        for s in self.students:
+            fee = float(s["monthly_fee"])
+            expected += fee
+            if s["id"] in paid_ids:
+                received += fee
+                paid.append((s, paid_ids[s["id"]]))
+            else:
+                unpaid.append(s)
+        return {"expected": expected, "received": received, "pending": expected - received,
+                "paid": paid, "unpaid": unpaid}
 
-        extra_ids = {
-            r["student_id"]
-            for r in st.session_state.reschedules
-            if r["new_date"] == date_str and r["status"] == "active"
-        }
-        for sid in extra_ids:
-            s = next((x for x in st.session_state.students if x["id"] == sid), None)
-            if s and s not in base:
-                base.append(s)
 
-    return base
+def get_fee_ledger() -> FeeLedger:
+    ledger = st.session_state.get("fee_ledger")
+    if ledger is None or ledger.students is not st.session_state.students:
+        ledger = st.session_state.fee_ledger = FeeLedger(st.session_state.students)
+    return ledger
 
+@counted
 def check_fee_status(student, month, year):
-    return any(p["month"] == month and p["year"] == year for p in student.get("fees_paid", []))
+    return get_fee_ledger().payment(student["id"], month, year) is not None
+
+def enrollment_months(students, attendance):
+    """student_id → (year, month) of their first class or payment; students with neither are left out."""
+    starts = {}
+    for a in attendance:
+        sid, ym = a["student_id"], (int(a["date"][:4]), int(a["date"][5:7]))
+        if sid not in starts or ym < starts[sid]:
+            starts[sid] = ym
+    for s in students:
+        for p in s.get("fees_paid", []):
+            ym = (p["year"], p["month"])
+            if s["id"] not in starts or ym < starts[s["id"]]:
+                starts[s["id"]] = ym
+    return starts
 
 def next_student_id():
     if not st.session_state.students:
         return 1
     return max(s["id"] for s in st.session_state.students) + 1
 
+def next_reschedule_id():
+    # reschedules are keyed by id in storage, so ids must never be reused —
+    # including those already archived, or still on their way to the archive
+    storage = get_storage()
+    queued  = get_save_queue().pending_ops() if _queue_saves(storage) else []
+    return max(chain((r["id"] for r in st.session_state.reschedules),
+                     (r["id"] for r in storage.load_archive()),
+                     (op["record"]["id"] for op in queued if op["op"] == "reschedule.archive")),
+               default=0) + 1
+
 def go(page):
     st.session_state.page = page
     st.rerun()
 
+class AttendanceIndex:
+    """Hash indexes over the attendance list, kept in step with every mutation.
+
+    by_key:     (student_id, date) → record
+    by_student: student_id → {date: record}
+    by_month:   (year, month) → {(student_id, date): record}
+    """
+
+    def __init__(self, records: list):
+        self.source     = records
+        self.by_key     = {}
+        self.by_student = {}
+        self.by_month   = {}
+        for rec in records:
+            self._add(rec)
+
+    def _add(self, rec):
+        key = (rec["student_id"], rec["date"])
+        self.by_key[key] = rec
+        self.by_student.setdefault(rec["student_id"], {})[rec["date"]] = rec
+        self.by_month.setdefault((int(rec["date"][:4]), int(rec["date"][5:7])), {})[key] = rec
+
+    def get(self, student_id, date_str):
+        return self.by_key.get((student_id, date_str))
+
+    def for_student(self, student_id) -> dict:
+        return self.by_student.get(student_id, {})
+
+    def upsert(self, rec):
+        """Insert rec, or update the existing record for its (student, date) in place."""
+        existing = self.by_key.get((rec["student_id"], rec["date"]))
+        if existing is not None:
+            existing.update(rec)
+            return existing
+        self.source.append(rec)
+        self._add(rec)
+        return rec
+
+    def drop_student(self, student_id):
+        if self.by_student.pop(student_id, None) is None:
+            return
+        self.source[:] = [a for a in self.source if a["student_id"] != student_id]
+        self.by_key = {k: v for k, v in self.by_key.items() if k[0] != student_id}
+        for marks in self.by_month.values():
+            for key in [k for k in marks if k[0] == student_id]:
+                del marks[key]
+
+
+def get_attendance_index() -> AttendanceIndex:
+    idx = st.session_state.get("attendance_index")
+    # rebuilt only when the attendance list itself is replaced (e.g. on load)
+    if idx is None or idx.source is not st.session_state.attendance:
+        idx = st.session_state.attendance_index = AttendanceIndex(st.session_state.attendance)
+    return idx
+
+class AttendanceFrame:
+    """Columnar copy of the attendance log (pandas) for the analytics page.
+
+    Built once per session, then patched as marks come in: a changed status
+    is written through the (student_id, date) → row map, and new records are
+    buffered and appended in one concat on the next read.
+    """
+
+    def __init__(self, records: list):
+        self.source  = records
+        self.df      = self._to_frame(records)
+        self.row     = {(sid, d): i for i, (sid, d) in
+                        enumerate(zip(self.df["student_id"], self.df["date_str"]))}
+        self.pending = []
+
+    @staticmethod
+    def _to_frame(records):
+        import pandas as pd
+        df = pd.DataFrame({
+            "student_id": pd.Series([a["student_id"] for a in records], dtype="int64"),
+            "date_str":   pd.Series([a["date"] for a in records], dtype="object"),
+            "present":    pd.Series([a["status"] == "present" for a in records], dtype="bool"),
+        })
+        df["date"] = pd.to_datetime(df["date_str"])
+        return df
+
+    def upsert(self, rec):
+        i = self.row.get((rec["student_id"], rec["date"]))
+        if i is None:
+            self.pending.append(rec)
+        else:
+            self.df.iat[i, self.df.columns.get_loc("present")] = rec["status"] == "present"
+
+    def frame(self) -> "pandas.DataFrame":
+        import pandas as pd
+        if self.pending:
+            # later marks in the buffer win over earlier ones for the same key
+            latest = {(a["student_id"], a["date"]): a for a in self.pending}
+            self.pending = []
+            start = len(self.df)
+            self.df = pd.concat([self.df, self._to_frame(list(latest.values()))], ignore_index=True)
+            self.row.update({key: start + i for i, key in enumerate(latest)})
+        return self.df
+
+
+def get_attendance_frame() -> AttendanceFrame:
+    frame = st.session_state.get("attendance_frame")
+    if frame is None or frame.source is not st.session_state.attendance:
+        frame = st.session_state.attendance_frame = AttendanceFrame(st.session_state.attendance)
+    return frame
+
+@counted
+def attendance_analytics(df: "pandas.DataFrame"):
+    """Per-student rates and streaks, monthly present/absent matrices and daily rates."""
+    df = df.sort_values(["student_id", "date"])
+    per_student = df.groupby("student_id")["present"].agg(present="sum", total="count")
+    per_student["absent"] = per_student["total"] - per_student["present"]
+    per_student["rate"]   = (per_student["present"] / per_student["total"] * 100).round(0)
+
+    # streaks: consecutive rows with the same status form a run
+    run_id    = (df["present"] != df.groupby("student_id")["present"].shift()).cumsum()
+    run_len   = df.groupby(run_id).cumcount() + 1
+    streaks   = df.assign(run_len=run_len)
+    last      = streaks.groupby("student_id").tail(1).set_index("student_id")
+    per_student["current_streak"] = last["run_len"].where(last["present"], 0)
+    per_student["best_streak"] = (streaks[streaks["present"]].groupby("student_id")["run_len"].max()
+                                  .reindex(per_student.index, fill_value=0))
+
+    month = df["date"].dt.to_period("M").astype(str)
+    monthly_present = df.pivot_table(index="student_id", columns=month, values="present",
+                                     aggfunc="sum", fill_value=0)
+    monthly_absent  = df.assign(absent=~df["present"]).pivot_table(
+        index="student_id", columns=month, values="absent", aggfunc="sum", fill_value=0)
+
+    daily = df.groupby("date")["present"].mean().mul(100).rename("rate").reset_index()
+    return per_student, monthly_present, monthly_absent, daily
+
+def month_label(period):
+    """'Mar 2025' for a period counted as year * 12 + month - 1."""
+    return f"{calendar.month_abbr[period % 12 + 1]} {period // 12}"
+
+@counted
+def arrears_report(students, starts, first, last):
+    """Unpaid months per student from `first` to `last`, both periods (year * 12 + month - 1).
+
+    Every month a student owes (from enrollment, or `first` if later) is laid
+    out as one (student, period) grid and the payments are masked out of it in
+    a single isin, so the whole range costs one pass over all fees_paid.
+    Returns (per-student table sorted by amount owed, per-month totals).
+    """
+    import numpy as np
+    import pandas as pd
+    enrolled = [s for s in students if s["id"] in starts]
+    sid   = np.array([s["id"] for s in enrolled], dtype="int64")
+    fee   = np.array([float(s["monthly_fee"]) for s in enrolled])
+    start = np.array([max(starts[s["id"]][0] * 12 + starts[s["id"]][1] - 1, first) for s in enrolled],
+                     dtype="int64")
+    count = np.clip(last - start + 1, 0, None)
+    # period of each grid row: its student's start plus its offset within that student's run
+    offset = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+    grid = pd.DataFrame({"student_id": np.repeat(sid, count), "fee": np.repeat(fee, count),
+                         "period": np.repeat(start, count) + offset})
+    paid = np.array([s["id"] * 100_000 + p["year"] * 12 + p["month"] - 1
+                     for s in enrolled for p in s.get("fees_paid", [])], dtype="int64")
+    owed = grid[~np.isin(grid["student_id"] * 100_000 + grid["period"], paid)]
+
+    per_student = owed.groupby("student_id").agg(
+        months=("period", "size"), owed=("fee", "sum"), since=("period", "min"),
+        periods=("period", lambda p: ", ".join(map(month_label, p))))
+    per_student = per_student.sort_values(["owed", "months"], ascending=False)
+    per_month = owed.groupby("period").agg(students=("student_id", "size"), owed=("fee", "sum"))
+    return per_student, per_month
+
+@counted
 def attendance_status(student_id, date_str):
-    rec = next((a for a in st.session_state.attendance
-                if a["student_id"] == student_id and a["date"] == date_str), None)
+    rec = get_attendance_index().get(student_id, date_str)
     return rec["status"] if rec else None
 
+@counted
+def mark_attendance_bulk(students, date_str, status):
+    """Mark every student in `students` as one mutation and one save."""
+    idx = get_attendance_index()
+    now = datetime.now().isoformat()
+    frame = st.session_state.get("attendance_frame")
+    recs = [
+        idx.upsert({
+            "student_id":   student["id"],
+            "student_name": student["name"],
+            "date":         date_str,
+            "status":       status,
+            "timestamp":    now
+        })
+        for student in students
+    ]
+    if frame is not None and frame.source is idx.source:
+        for rec in recs:
+            frame.upsert(rec)
+    if recs:
+        save_data(*({"op": "attendance.put", "record": rec} for rec in recs))
+    return recs
+
 def mark_attendance(student, date_str, status):
-    st.session_state.attendance = [
-        a for a in st.session_state.attendance
-        if not (a["student_id"] == student["id"] and a["date"] == date_str)
+    return mark_attendance_bulk([student], date_str, status)[0]
+
+@counted
+def pay_fees_bulk(students, month, year):
+    """Record this month's fee for every unpaid student in `students`, with one save."""
+    ledger = get_fee_ledger()
+    ops = [
+        {"op": "fee.put", "student_id": s["id"], "payment": ledger.pay(s, month, year)}
+        for s in students
+        if ledger.payment(s["id"], month, year) is None
     ]
-    st.session_state.attendance.append({
-        "student_id":   student["id"],
-        "student_name": student["name"],
-        "date":         date_str,
-        "status":       status,
-        "timestamp":    datetime.now().isoformat()
-    })
-    save_data()
-    st.rerun()
+    if ops:
+        save_data(*ops)
+    return len(ops)
+
+def validate_student(name, grade, subject, fee, schedule):
+    """The Add Student rules. Returns the problems found, empty if the student is valid."""
+    errors = []
+    if not name.strip():   errors.append("Name is required")
+    if not grade.strip():  errors.append("Grade is required")
+    if not subject.strip():errors.append("Subject is required")
+    if fee <= 0:           errors.append("Monthly fee must be > 0")
+    if not schedule:       errors.append("Select at least one day with a time")
+    for day, slot in schedule.items():
+        if not parse_slot(slot):
+            errors.append(f"{day}: enter the time like 4:00 PM – 5:00 PM")
+    return errors
+
+
+# ── CSV export / import ──
+# Exports are generators that encode one row at a time; the download buttons
+# hand Streamlit a callable, so a file is only produced when it's clicked and
+# never on a rerun of the page. The roster export doubles as the import template.
+
+ROSTER_COLUMNS     = ["id", "name", "grade", "subject", "monthly_fee", "contact"] + DAY_NAMES
+ATTENDANCE_COLUMNS = ["date", "student_id", "student_name", "status", "marked_at"]
+FEE_COLUMNS        = ["month", "student_id", "student_name", "monthly_fee", "status", "amount", "paid_on"]
+
+def iter_csv(header, rows):
+    """Encoded CSV lines, header first. Starts with a BOM so Excel reads the file as UTF-8."""
+    buf = io.StringIO()
+    out = csv.writer(buf)
+    yield "\ufeff".encode()
+    for row in chain([header], rows):
+        out.writerow(row)
+        yield buf.getvalue().encode()
+        buf.seek(0)
+        buf.truncate()
+
+def with_years(students, attendance, part):
+    """students / attendance plus a load_years() result, leaving the session's lists untouched."""
+    fees = part["fees"]
+    students = [dict(s, fees_paid=s.get("fees_paid", []) + fees[s["id"]]) if s["id"] in fees else s
+                for s in students]
+    return students, attendance + part["attendance"]
+
+def roster_rows(students):
+    for s in students:
+        ts = s.get("time_slot", {})
+        ts = ts if isinstance(ts, dict) else {}
+        yield ([s["id"], s["name"], s["grade"], s["subject"], s["monthly_fee"], s.get("contact", "")]
+               + [ts.get(day, "") for day in DAY_NAMES])
+
+def attendance_rows(attendance, students):
+    names = {s["id"]: s["name"] for s in students}
+    for a in sorted(attendance, key=lambda a: (a["date"], a["student_id"])):
+        yield [a["date"], a["student_id"], names.get(a["student_id"], a.get("student_name", "")),
+               a["status"], a.get("timestamp", "")]
+
+def fee_rows(students, attendance, until):
+    """One row per student per month, from their first class or payment up to `until` (year, month)."""
+    ledger = FeeLedger(students)
+    starts = {sid: min(ym, until) for sid, ym in enrollment_months(students, attendance).items()}
+    year, month = min(starts.values(), default=until)
+    while (year, month) <= until:
+        for s in students:
+            if starts.get(s["id"], until) > (year, month):
+                continue
+            p = ledger.payment(s["id"], month, year)
+            yield [f"{year:04d}-{month:02d}", s["id"], s["name"], s["monthly_fee"],
+                   "paid" if p else "unpaid", p["amount"] if p else "", p["date"][:10] if p else ""]
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+def _read_csv(text, required):
+    """Rows of a CSV as dicts with normalised headers, or raise ValueError naming missing columns."""
+    reader = csv.DictReader(io.StringIO(text.lstrip("\ufeff")))
+    reader.fieldnames = [(f or "").strip().lower().replace(" ", "_") for f in reader.fieldnames or []]
+    missing = [c for c in required if c not in reader.fieldnames]
+    if missing:
+        raise ValueError(f"missing column(s): {', '.join(missing)}")
+    return [{k: (v or "").strip() for k, v in row.items() if k} for row in reader]
+
+def _parse_fee(text):
+    try:
+        fee = float(text.replace(",", "").lstrip("₹"))
+    except ValueError:
+        return 0
+    return int(fee) if fee.is_integer() else fee
+
+@counted
+def import_csv(roster_text="", attendance_text=""):
+    """Validate a roster CSV and/or an attendance CSV and add them as one batch and one save.
+
+    Nothing is written unless every row is valid. Attendance rows name their
+    student by student_id (an existing student) or by name (existing or in the
+    roster being imported). Returns (students added, marks added, errors).
+    """
+    errors, students, marks = [], [], []
+
+    try:
+        rows = _read_csv(roster_text, ["name", "grade", "subject", "monthly_fee"]) if roster_text else []
+    except ValueError as e:
+        rows, errors = [], [f"Students file: {e}"]
+    next_id = next_student_id()
+    for n, row in enumerate(rows, start=2):
+        fee      = _parse_fee(row.get("monthly_fee", ""))
+        schedule = {day: row[day.lower()] for day in DAY_NAMES if row.get(day.lower())}
+        problems = validate_student(row.get("name", ""), row.get("grade", ""), row.get("subject", ""), fee, schedule)
+        errors  += [f"Students row {n}: {p}" for p in problems]
+        if not problems:
+            students.append({
+                "id":          next_id + len(students),
+                "name":        row["name"],
+                "grade":       row["grade"],
+                "subject":     row["subject"],
+                "time_slot":   {day: normalize_slot(t) for day, t in schedule.items()},
+                "monthly_fee": fee,
+                "contact":     row.get("contact", ""),
+                "fees_paid":   []
+            })
+
+    try:
+        rows = _read_csv(attendance_text, ["date", "status"]) if attendance_text else []
+    except ValueError as e:
+        rows, errors = [], errors + [f"Attendance file: {e}"]
+    by_id   = {s["id"]: s for s in st.session_state.students}
+    by_name = {}
+    for s in st.session_state.students + students:
+        by_name.setdefault(s["name"].strip().lower(), []).append(s)
+    for n, row in enumerate(rows, start=2):
+        sid, name = row.get("student_id", ""), row.get("student_name") or row.get("name", "")
+        matches = [by_id[int(sid)]] if sid.isdigit() and int(sid) in by_id else by_name.get(name.lower(), [])
+        try:
+            day = date.fromisoformat(row["date"]).isoformat()
+        except ValueError:
+            errors.append(f"Attendance row {n}: date must look like 2024-06-30")
+            continue
+        if len(matches) != 1:
+            errors.append(f"Attendance row {n}: " + ("more than one student is called " + name if matches
+                                                    else f"no student {sid or name!r}"))
+        elif row["status"].lower() not in STATUS_CODES:
+            errors.append(f"Attendance row {n}: status must be present or absent")
+        else:
+            marks.append((matches[0], day, row["status"].lower(), row.get("marked_at") or datetime.now().isoformat()))
+
+    if errors or not (students or marks):
+        return 0, 0, errors
+
+    ensure_years_loaded({int(day[:4]) for _, day, _, _ in marks})
+    st.session_state.students.extend(students)
+    idx   = get_attendance_index()
+    frame = st.session_state.get("attendance_frame")
+    recs  = [
+        idx.upsert({
+            "student_id":   s["id"],
+            "student_name": s["name"],
+            "date":         day,
+            "status":       status,
+            "timestamp":    stamp
+        })
+        for s, day, status, stamp in marks
+    ]
+    if frame is not None and frame.source is idx.source:
+        for rec in recs:
+            frame.upsert(rec)
+    save_data(*({"op": "student.put", "student": s} for s in students),
+              *({"op": "attendance.put", "record": rec} for rec in recs))
+    return len(students), len(recs), []
+
+
+def expire_reschedules(reschedules, today, keep_days=0):
+    """Move reschedules whose original and new dates are both over out of `reschedules`, in place.
+
+    Only the dates matter, so cancelled ones go too. Returns the change
+    records that put them in the archive.
+    """
+    cutoff = (today - timedelta(days=keep_days)).isoformat()
+    expired = [r for r in reschedules if max(r["original_date"], r["new_date"]) < cutoff]
+    if expired:
+        gone = {r["id"] for r in expired}
+        reschedules[:] = [r for r in reschedules if r["id"] not in gone]
+    return [{"op": "reschedule.archive", "record": r} for r in expired]
+
+# once per session: free-text slots saved before they were parsed are
+# rewritten, and reschedules that are over move to the archive
+if "housekeeping_done" not in st.session_state:
+    st.session_state.housekeeping_done = True
+    housekeeping = (migrate_time_slots(st.session_state.students, st.session_state.reschedules)
+                    + expire_reschedules(st.session_state.reschedules, date.today(),
+                                         int(st.secrets.get("RESCHEDULE_RETENTION_DAYS", 0))))
+    if housekeeping:
+        save_data(*housekeeping)
 
 
+# ─────────────────────────────────────────────
+# CARD FRAGMENTS
+# ─────────────────────────────────────────────
+# Each per-student card is an st.fragment, so a Present/Absent or
+# Mark-as-Paid tap reruns just that card instead of the whole app. The tap
+# is applied in an on_click callback (before the card redraws), and the
+# card then redraws the page counters into their placeholder.
+
+def _on_mark(student, date_str, status):
+    mark_attendance(student, date_str, status)
+    st.session_state.counters_stale = True
+
+def _on_pay(student, month, year):
+    payment = get_fee_ledger().pay(student, month, year)
+    save_data({"op": "fee.put", "student_id": student["id"], "payment": payment})
+    st.toast(f"✅ ₹{student['monthly_fee']} received from {student['name']}")
+    st.session_state.counters_stale = True
+
+def _on_bulk_mark(students, date_str, status, select_key=None):
+    mark_attendance_bulk(students, date_str, status)
+    if select_key:
+        st.session_state[select_key] = []
+    st.toast(f"Marked {len(students)} student(s) {status}")
+
+def _on_bulk_pay(month, year, select_key):
+    picked   = set(st.session_state.get(select_key, []))
+    students = [s for s in st.session_state.students if s["id"] in picked]
+    n = pay_fees_bulk(students, month, year)
+    st.session_state[select_key] = []
+    st.toast(f"✅ {n} fee(s) marked as paid")
+
+def _on_unpay(student, month, year):
+    get_fee_ledger().unpay(student, month, year)
+    save_data({"op": "fee.delete", "student_id": student["id"], "month": month, "year": year})
+    st.toast(f"↩️ Marked {student['name']} as unpaid")
+    st.session_state.counters_stale = True
+
+def render_attendance_metrics(slot, scheduled, date_str):
+    statuses = [attendance_status(s["id"], date_str) for s in scheduled]
+    present_count = statuses.count("present")
+    absent_count  = statuses.count("absent")
+    unmarked      = len(scheduled) - present_count - absent_count
+    st.session_state.counters_stale = False
+    with slot.container():
+        m1, m2, m3 = st.columns(3)
+        m1.metric("Total",    len(scheduled))
+        m2.metric("Present",  present_count)
+        m3.metric("Absent",   absent_count)
+        if unmarked > 0:
+            st.warning(f"⚠️ {unmarked} student(s) not yet marked")
+
+def render_fee_metrics(slot, month, year):
+    summary = get_fee_ledger().summary(month, year)
+    st.session_state.counters_stale = False
+    with slot.container():
+        m1, m2, m3 = st.columns(3)
+        m1.metric("Expected",  f"₹{summary['expected']:,.0f}")
+        m2.metric("Received",  f"₹{summary['received']:,.0f}")
+        m3.metric("Pending",   f"₹{summary['pending']:,.0f}")
+    return summary
+
+@st.fragment
+@traced_fragment
+def today_card(student, today_date, today_name):
+    reschedule = get_schedule_index().reschedule_to(student["id"], str(today_date))
+    time_display = reschedule["new_time"] if reschedule else get_time_for_day(student, today_name)
+    att_status = attendance_status(student["id"], str(today_date))
+
+    with st.expander(f"👤 {student['name']} — {time_display}", expanded=True):
+        c1, c2 = st.columns(2)
+        c1.write(f"**Grade:** {student['grade']}")
+        c1.write(f"**Subject:** {student['subject']}")
+        c2.write(f"**Fee:** ₹{student['monthly_fee']}")
+        if reschedule:
+            st.info(f"🔄 Rescheduled from {reschedule['original_date']}")
+
+        if att_status == "present":
+            st.success("✅ Marked Present")
+        elif att_status == "absent":
+            st.error("❌ Marked Absent")
+
+        bc1, bc2 = st.columns(2)
+        with bc1:
+            st.button("✅ Present", key=f"hp_{student['id']}", use_container_width=True,
+                      on_click=_on_mark, args=(student, str(today_date), "present"))
+        with bc2:
+            st.button("❌ Absent", key=f"ha_{student['id']}", use_container_width=True,
+                      on_click=_on_mark, args=(student, str(today_date), "absent"))
+
+@st.fragment
+@traced_fragment
+def attendance_card(student, day_name, date_str, scheduled, metrics_slot):
+    reschedule = get_schedule_index().reschedule_to(student["id"], date_str)
+    time_display = reschedule["new_time"] if reschedule else get_time_for_day(student, day_name)
+    att = attendance_status(student["id"], date_str)
+
+    with st.expander(
+        f"{'✅' if att=='present' else '❌' if att=='absent' else '⏳'} "
+        f"{student['name']} — {time_display}",
+        expanded=(att is None)
+    ):
+        st.write(f"**Grade:** {student['grade']} | **Subject:** {student['subject']}")
+        if reschedule:
+            st.info(f"🔄 Rescheduled from {reschedule['original_date']}")
+
+        bc1, bc2 = st.columns(2)
+        with bc1:
+            p_type = "primary" if att == "present" else "secondary"
+            st.button("✅ Present", key=f"p_{student['id']}_{date_str}",
+                      type=p_type, use_container_width=True,
+                      on_click=_on_mark, args=(student, date_str, "present"))
+        with bc2:
+            a_type = "primary" if att == "absent" else "secondary"
+            st.button("❌ Absent", key=f"a_{student['id']}_{date_str}",
+                      type=a_type, use_container_width=True,
+                      on_click=_on_mark, args=(student, date_str, "absent"))
+    if st.session_state.pop("counters_stale", False):
+        render_attendance_metrics(metrics_slot, scheduled, date_str)
+
+@st.fragment
+@traced_fragment
+def fee_card(student, month, year, metrics_slot):
+    # paid cards stay in their tab until the next full run; they flip in place
+    ledger  = get_fee_ledger()
+    payment = ledger.payment(student["id"], month, year)
+    icon    = "✅" if payment else "💸"
+    with st.expander(f"{icon} {student['name']} — ₹{student['monthly_fee']}"):
+        st.write(f"**Grade:** {student['grade']} | **Subject:** {student['subject']}")
+        if payment:
+            paid_on = payment.get("date", "")[:10]
+            if paid_on:
+                st.caption(f"Paid on: {paid_on}")
+            # allow un-marking
+            st.button(f"↩️ Mark as Unpaid", key=f"unpay_{student['id']}_{month}_{year}",
+                      use_container_width=True,
+                      on_click=_on_unpay, args=(student, month, year))
+        else:
+            if student.get("contact"):
+                st.write(f"**Phone:** {student['contact']}")
+            st.button(f"💰 Mark as Paid", key=f"pay_{student['id']}_{month}_{year}",
+                      type="primary", use_container_width=True,
+                      on_click=_on_pay, args=(student, month, year))
+    if st.session_state.pop("counters_stale", False):
+        render_fee_metrics(metrics_slot, month, year)
+
+
+perf_section("definitions")
+
 # ─────────────────────────────────────────────
 # NAV BAR
 # ─────────────────────────────────────────────
 st.markdown("## 📚 Tuition Tracker")
+if st.session_state.get("tenant"):
+    c1, c2 = st.columns([3, 1])
+    c1.caption(f"👤 Signed in as **{st.session_state.tenant}**")
+    if c2.button("Sign out", key="sign_out", use_container_width=True):
+        st.session_state.clear()
+        st.rerun()
+render_sync_status()
 
 pages = [
     ("🏠", "Today",     "home"),
@@ -249,6 +2922,8 @@ pages = [
     ("💰", "Fees",      "fees"),
     ("🔄", "Reschedule","reschedule"),
 ]
+if "diagnostics" in st.query_params or st.secrets.get("DIAGNOSTICS", False):
+    pages.append(("🩺", "Diagnostics", "diagnostics"))
 
 cols = st.columns(len(pages))
 for col, (icon, label, pg) in zip(cols, pages):
@@ -259,6 +2934,7 @@ for col, (icon, label, pg) in zip(cols, pages):
             st.rerun()
 
 st.markdown("---")
+perf_section("nav")
 
 
 # ════════════════════════════════════════════════════════════
@@ -279,11 +2955,7 @@ if st.session_state.page == "home":
     m1, m2, m3 = st.columns(3)
     m1.metric("Today's Classes", len(today_students))
     m2.metric("Total Students",  len(st.session_state.students))
-    fees_received = sum(
-        float(s["monthly_fee"])
-        for s in st.session_state.students
-        if check_fee_status(s, current_month, current_year)
-    )
+    fees_received = get_fee_ledger().summary(current_month, current_year)["received"]
     m3.metric("Fees This Month", f"₹{fees_received:,.0f}")
 
     st.markdown("---")
@@ -291,47 +2963,96 @@ if st.session_state.page == "home":
     if today_students:
         st.markdown(f"**{len(today_students)} class{'es' if len(today_students)>1 else ''} scheduled**")
         for student in today_students:
-            reschedule = next(
-                (r for r in st.session_state.reschedules
-                 if r["student_id"] == student["id"]
-                 and r["new_date"] == str(today_date)
-                 and r["status"] == "active"), None
-            )
-            time_display = reschedule["new_time"] if reschedule else get_time_for_day(student, today_name)
-            att_status = attendance_status(student["id"], str(today_date))
-
-            with st.expander(f"👤 {student['name']} — {time_display}", expanded=True):
-                c1, c2 = st.columns(2)
-                c1.write(f"**Grade:** {student['grade']}")
-                c1.write(f"**Subject:** {student['subject']}")
-                c2.write(f"**Fee:** ₹{student['monthly_fee']}")
-                if reschedule:
-                    st.info(f"🔄 Rescheduled from {reschedule['original_date']}")
-
-                if att_status == "present":
-                    st.success("✅ Marked Present")
-                elif att_status == "absent":
-                    st.error("❌ Marked Absent")
-
-                bc1, bc2 = st.columns(2)
-                with bc1:
-                    if st.button("✅ Present", key=f"hp_{student['id']}", use_container_width=True):
-                        mark_attendance(student, str(today_date), "present")
-                with bc2:
-                    if st.button("❌ Absent", key=f"ha_{student['id']}", use_container_width=True):
-                        mark_attendance(student, str(today_date), "absent")
+            today_card(student, today_date, today_name)
     else:
         st.success("🎉 No classes today! Enjoy your day.")
 
     # ── upcoming week preview ──
     st.markdown("---")
     st.subheader("📆 Upcoming Week")
-    for i in range(1, 7):
-        upcoming = today_date + timedelta(days=i)
-        up_name  = upcoming.strftime("%A")
-        up_count = len(get_students_for_day(up_name, upcoming))
-        if up_count:
-            st.write(f"**{upcoming.strftime('%a %d %b')}** — {up_count} class{'es' if up_count>1 else ''}")
+    upcoming = get_schedule_index().occurrences(today_date + timedelta(days=1), today_date + timedelta(days=6))
+    for day, classes in upcoming.items():
+        up_count = len(classes)
+        st.write(f"**{day.strftime('%a %d %b')}** — {up_count} class{'es' if up_count>1 else ''}")
+    if st.button("🗓️ Open Calendar", use_container_width=True):
+        go("calendar")
+
+
+# ════════════════════════════════════════════════════════════
+# PAGE: CALENDAR
+# ════════════════════════════════════════════════════════════
+elif st.session_state.page == "calendar":
+    st.subheader("🗓️ Calendar")
+    if st.button("← Back to Today"):
+        go("home")
+
+    if "cal_anchor" not in st.session_state:
+        st.session_state.cal_anchor = date.today()
+    anchor = st.session_state.cal_anchor
+    view = st.radio("View", ["Week", "Month"], horizontal=True, label_visibility="collapsed")
+
+    if view == "Week":
+        start = anchor - timedelta(days=anchor.weekday())
+        end   = start + timedelta(days=6)
+        label = f"{start.strftime('%d %b')} – {end.strftime('%d %b %Y')}"
+        step  = timedelta(days=7)
+    else:
+        start = anchor.replace(day=1)
+        end   = start.replace(day=calendar.monthrange(start.year, start.month)[1])
+        label = start.strftime("%B %Y")
+        step  = None
+
+    c1, c2, c3 = st.columns([1, 2, 1])
+    with c1:
+        if st.button("◀", key="cal_prev", use_container_width=True):
+            st.session_state.cal_anchor = anchor - step if step else (start - timedelta(days=1)).replace(day=1)
+            st.rerun()
+    with c2:
+        st.markdown(f"<div style='text-align:center;font-weight:600;padding-top:6px'>{label}</div>",
+                    unsafe_allow_html=True)
+    with c3:
+        if st.button("▶", key="cal_next", use_container_width=True):
+            st.session_state.cal_anchor = anchor + step if step else end + timedelta(days=1)
+            st.rerun()
+
+    occurrences = get_schedule_index().occurrences(start, end)
+
+    if view == "Week":
+        for n in range(7):
+            day     = start + timedelta(days=n)
+            classes = occurrences.get(day, [])
+            title   = f"**{day.strftime('%A, %d %b')}**" + (" · today" if day == date.today() else "")
+            with st.container(border=True):
+                st.markdown(title)
+                if not classes:
+                    st.caption("No classes")
+                for student, slot, moved in classes:
+                    st.write(f"{'🔄 ' if moved else ''}{student['name']} — {slot}")
+    else:
+        import pandas as pd
+        weeks = calendar.Calendar().monthdatescalendar(start.year, start.month)
+        grid = pd.DataFrame(
+            [[(f"{d.day} · {len(occurrences[d])}" if d in occurrences else str(d.day))
+              if d.month == start.month else "" for d in week] for week in weeks],
+            columns=[d[:3] for d in DAY_NAMES],
+        )
+        st.caption("Day · number of classes")
+        st.dataframe(grid, use_container_width=True, hide_index=True)
+
+        st.markdown("##### 📊 Classes per student")
+        ensure_years_loaded([start.year])
+        counts = class_counts(start, end)
+        rows = []
+        for s in st.session_state.students:
+            c = counts.get(s["id"], {}).get((start.year, start.month))
+            if c:
+                rows.append({"Student": s["name"], "Scheduled": c["scheduled"], "Held so far": c["held"],
+                             "Present": c["present"], "Absent": c["absent"],
+                             "Unmarked": max(c["held"] - c["present"] - c["absent"], 0)})
+        if rows:
+            st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+        else:
+            st.info("No classes this month.")
 
 
 # ════════════════════════════════════════════════════════════
@@ -340,11 +3061,16 @@ if st.session_state.page == "home":
 elif st.session_state.page == "students":
     st.subheader("👥 All Students")
 
-    if st.button("➕ Add New Student", type="primary", use_container_width=True):
-        st.session_state.edit_student  = None
-        st.session_state.selected_days = {}
-        st.session_state.page = "add_student"
-        st.rerun()
+    c1, c2 = st.columns(2)
+    with c1:
+        if st.button("➕ Add New Student", type="primary", use_container_width=True):
+            st.session_state.edit_student  = None
+            st.session_state.selected_days = {}
+            st.session_state.page = "add_student"
+            st.rerun()
+    with c2:
+        if st.button("📦 Import / Export", use_container_width=True):
+            go("data")
 
     st.markdown("---")
 
@@ -352,21 +3078,39 @@ elif st.session_state.page == "students":
         st.info("No students yet. Tap **Add New Student** to get started!")
     else:
         # search
-        search = st.text_input("🔍 Search by name", placeholder="Type a name…")
+        search = st.text_input("🔍 Search by name", placeholder="Type a name…",
+                               on_change=lambda: st.session_state.update(students_page=0))
         filtered = [
             s for s in st.session_state.students
             if search.lower() in s["name"].lower()
         ] if search else st.session_state.students
 
-        st.write(f"Showing {len(filtered)} of {len(st.session_state.students)} students")
+        # ── paging: only one page of cards is built per rerun ──
+        page_size = st.session_state.students_page_size
+        n_pages   = max(1, -(-len(filtered) // page_size))
+        page_no   = min(st.session_state.students_page, n_pages - 1)
+        shown     = filtered[page_no * page_size:(page_no + 1) * page_size]
+
+        st.write(f"Showing {len(shown)} of {len(filtered)} matching · {len(st.session_state.students)} students")
 
-        for student in filtered:
-            current_month = datetime.now().month
-            current_year  = datetime.now().year
-            fee_paid = check_fee_status(student, current_month, current_year)
+        current_month = datetime.now().month
+        current_year  = datetime.now().year
+
+        for student in shown:
+            fee_paid  = check_fee_status(student, current_month, current_year)
             fee_badge = "✅ Paid" if fee_paid else "⏳ Pending"
+            is_open   = st.session_state.open_student == student["id"]
+
+            # the card body is only built for the card that is open
+            if st.button(f"{'▾' if is_open else '▸'} 👤 {student['name']} | {student['grade']} | {fee_badge}",
+                         key=f"card_{student['id']}", use_container_width=True):
+                st.session_state.open_student   = None if is_open else student["id"]
+                st.session_state.confirm_delete = None
+                st.rerun()
+            if not is_open:
+                continue
 
-            with st.expander(f"👤 {student['name']} | {student['grade']} | {fee_badge}"):
+            with st.container(border=True):
                 c1, c2 = st.columns(2)
                 c1.write(f"**Subject:** {student['subject']}")
                 c1.write(f"**Fee:** ₹{student['monthly_fee']}/mo")
@@ -376,8 +3120,8 @@ elif st.session_state.page == "students":
                 ts = student.get("time_slot", {})
                 if isinstance(ts, dict) and ts:
                     c2.write("**Schedule:**")
-                    for day, time in ts.items():
-                        c2.caption(f"• {day}: {time}")
+                    for day, slot in ts.items():
+                        c2.caption(f"• {day}: {slot}")
 
                 bc1, bc2 = st.columns(2)
                 with bc1:
@@ -399,10 +3143,12 @@ elif st.session_state.page == "students":
                         if st.button("✅ Yes, Delete", key=f"yes_del_{student['id']}", type="primary", use_container_width=True):
                             sid = student["id"]
                             st.session_state.students   = [s for s in st.session_state.students   if s["id"] != sid]
-                            st.session_state.attendance = [a for a in st.session_state.attendance if a["student_id"] != sid]
+                            get_attendance_index().drop_student(sid)
+                            st.session_state.pop("attendance_frame", None)
                             st.session_state.reschedules= [r for r in st.session_state.reschedules if r["student_id"] != sid]
                             st.session_state.confirm_delete = None
-                            save_data()
+                            st.session_state.open_student   = None
+                            save_data({"op": "student.delete", "student_id": sid})
                             st.success("Student deleted.")
                             st.rerun()
                     with cc2:
@@ -410,6 +3156,28 @@ elif st.session_state.page == "students":
                             st.session_state.confirm_delete = None
                             st.rerun()
 
+        if n_pages > 1:
+            pc1, pc2, pc3 = st.columns([1, 2, 1])
+            with pc1:
+                if st.button("◀ Prev", key="students_prev", disabled=page_no == 0, use_container_width=True):
+                    st.session_state.students_page = page_no - 1
+                    st.session_state.open_student  = None
+                    st.rerun()
+            pc2.markdown(f"<div style='text-align:center;padding-top:12px'>Page {page_no + 1} of {n_pages}</div>",
+                         unsafe_allow_html=True)
+            with pc3:
+                if st.button("Next ▶", key="students_next", disabled=page_no >= n_pages - 1, use_container_width=True):
+                    st.session_state.students_page = page_no + 1
+                    st.session_state.open_student  = None
+                    st.rerun()
+
+        sizes    = sorted(set(STUDENTS_PAGE_SIZES) | {page_size})
+        new_size = st.selectbox("Students per page", sizes, index=sizes.index(page_size))
+        if new_size != page_size:
+            st.session_state.students_page_size = new_size
+            st.session_state.students_page      = 0
+            st.rerun()
+
 
 # ════════════════════════════════════════════════════════════
 # PAGE: ADD / EDIT STUDENT
@@ -450,6 +3218,10 @@ elif st.session_state.page == "add_student":
                                   placeholder="4:00 PM – 5:00 PM",
                                   label_visibility="collapsed")
                 st.session_state.selected_days[day] = t
+                if t.strip() and not parse_slot(t):
+                    st.caption("⚠️ Use a time like 4:00 PM – 5:00 PM")
+                for other, slot in get_schedule_index().clashes(day, t, exclude=existing.get("id")):
+                    st.caption(f"⚠️ Overlaps {other['name']} ({slot})")
 
     if st.session_state.selected_days:
         st.info(f"✅ {len(st.session_state.selected_days)} day(s) selected: " +
@@ -461,13 +3233,8 @@ elif st.session_state.page == "add_student":
     with c1:
         btn_label = "💾 Save Changes" if editing else "✅ Add Student"
         if st.button(btn_label, type="primary", use_container_width=True):
-            schedule = {d: t for d, t in st.session_state.selected_days.items() if t.strip()}
-            errors = []
-            if not name.strip():   errors.append("Name is required")
-            if not grade.strip():  errors.append("Grade is required")
-            if not subject.strip():errors.append("Subject is required")
-            if fee <= 0:           errors.append("Monthly fee must be > 0")
-            if not schedule:       errors.append("Select at least one day with a time")
+            schedule = {d: normalize_slot(t.strip()) for d, t in st.session_state.selected_days.items() if t.strip()}
+            errors = validate_student(name, grade, subject, fee, schedule)
 
             if errors:
                 for e in errors:
@@ -482,10 +3249,11 @@ elif st.session_state.page == "add_student":
                             s["monthly_fee"] = fee
                             s["contact"]     = contact.strip()
                             s["time_slot"]   = schedule
+                            saved = s
                             break
                     msg = f"✅ {name} updated!"
                 else:
-                    st.session_state.students.append({
+                    saved = {
                         "id":          next_student_id(),
                         "name":        name.strip(),
                         "grade":       grade.strip(),
@@ -494,10 +3262,11 @@ elif st.session_state.page == "add_student":
                         "monthly_fee": fee,
                         "contact":     contact.strip(),
                         "fees_paid":   []
-                    })
+                    }
+                    st.session_state.students.append(saved)
                     msg = f"✅ {name} added!"
 
-                save_data()
+                save_data({"op": "student.put", "student": saved})
                 st.session_state.selected_days = {}
                 st.session_state.edit_student  = None
                 st.success(msg)
@@ -513,6 +3282,64 @@ elif st.session_state.page == "add_student":
             st.rerun()
 
 
+# ════════════════════════════════════════════════════════════
+# PAGE: IMPORT / EXPORT
+# ════════════════════════════════════════════════════════════
+elif st.session_state.page == "data":
+    st.subheader("📦 Import / Export")
+    if st.button("← Back to Students"):
+        go("students")
+
+    st.markdown("**⬇️ Export (CSV, opens in Excel)**")
+    students, attendance = st.session_state.students, st.session_state.attendance
+    storage, older = get_storage(), unloaded_years()
+    today = date.today()
+
+    def every_year():
+        # exports cover every year; the ones this session hasn't opened are
+        # read only when a download is clicked, and aren't kept afterwards
+        if not older:
+            return students, attendance
+        return with_years(students, attendance, storage.load_years(older))
+
+    exports = [
+        ("👥 Student roster", "students", lambda: iter_csv(ROSTER_COLUMNS, roster_rows(students))),
+        ("✅ Attendance log", "attendance",
+         lambda: iter_csv(ATTENDANCE_COLUMNS, attendance_rows(every_year()[1], students))),
+        ("💰 Fee ledger by month", "fees",
+         lambda: iter_csv(FEE_COLUMNS, fee_rows(*every_year(), (today.year, today.month)))),
+    ]
+    for label, stem, lines in exports:
+        # download_button takes the file whole, so the generated rows are
+        # joined once, when its button is clicked
+        st.download_button(label, data=lambda lines=lines: b"".join(lines()),
+                           file_name=f"{stem}_{today.isoformat()}.csv", mime="text/csv",
+                           key=f"export_{stem}", use_container_width=True)
+
+    st.markdown("---")
+    st.markdown("**⬆️ Import from CSV**")
+    st.caption("Students: name, grade, subject, monthly_fee, contact and one column per weekday holding "
+               "that day's time (the roster export has this layout; its id column is ignored). "
+               "Attendance: date (YYYY-MM-DD), student_name or student_id, status (present / absent).")
+    roster_file     = st.file_uploader("Students CSV", type="csv", key="import_students")
+    attendance_csv  = st.file_uploader("Attendance CSV", type="csv", key="import_attendance")
+    if st.button("📥 Import", type="primary", use_container_width=True,
+                 disabled=not (roster_file or attendance_csv)):
+        added, marked, errors = import_csv(
+            roster_file.getvalue().decode("utf-8-sig") if roster_file else "",
+            attendance_csv.getvalue().decode("utf-8-sig") if attendance_csv else "")
+        if errors:
+            st.error(f"⚠️ Nothing imported: {len(errors)} problem(s) found")
+            for e in errors[:20]:
+                st.caption(f"• {e}")
+            if len(errors) > 20:
+                st.caption(f"…and {len(errors) - 20} more")
+        elif added or marked:
+            st.success(f"✅ Imported {added} student(s) and {marked} attendance record(s)")
+        else:
+            st.info("Those files have no rows to import.")
+
+
 # ════════════════════════════════════════════════════════════
 # PAGE: ATTENDANCE
 # ════════════════════════════════════════════════════════════
@@ -522,55 +3349,40 @@ elif st.session_state.page == "attendance":
     selected_date = st.date_input("📆 Select Date", value=date.today())
     day_name  = selected_date.strftime("%A")
     date_str  = str(selected_date)
+    ensure_years_loaded([selected_date.year])
 
     scheduled = get_students_for_day(day_name, selected_date)
 
     if not scheduled:
         st.info(f"No classes scheduled on {day_name}, {selected_date.strftime('%d %b %Y')}.")
     else:
-        present_count = sum(1 for s in scheduled if attendance_status(s["id"], date_str) == "present")
-        absent_count  = sum(1 for s in scheduled if attendance_status(s["id"], date_str) == "absent")
-        unmarked      = len(scheduled) - present_count - absent_count
-
-        m1, m2, m3 = st.columns(3)
-        m1.metric("Total",    len(scheduled))
-        m2.metric("Present",  present_count)
-        m3.metric("Absent",   absent_count)
-
-        if unmarked > 0:
-            st.warning(f"⚠️ {unmarked} student(s) not yet marked")
+        metrics_slot = st.empty()
+        render_attendance_metrics(metrics_slot, scheduled, date_str)
+
+        # ── bulk actions: one mutation and one save for the whole batch ──
+        with st.expander("⚡ Bulk actions"):
+            st.button("✅ Mark all scheduled present", key=f"bulk_all_{date_str}",
+                      type="primary", use_container_width=True,
+                      on_click=_on_bulk_mark, args=(scheduled, date_str, "present"))
+            by_id = {s["id"]: s for s in scheduled}
+            select_key = f"bulk_sel_{date_str}"
+            picked = st.multiselect("Select students", list(by_id), key=select_key,
+                                    format_func=lambda sid: by_id[sid]["name"])
+            picked_students = [by_id[sid] for sid in picked if sid in by_id]
+            bc1, bc2 = st.columns(2)
+            with bc1:
+                st.button("✅ Present", key=f"bulk_p_{date_str}", disabled=not picked_students,
+                          use_container_width=True,
+                          on_click=_on_bulk_mark, args=(picked_students, date_str, "present", select_key))
+            with bc2:
+                st.button("❌ Absent", key=f"bulk_a_{date_str}", disabled=not picked_students,
+                          use_container_width=True,
+                          on_click=_on_bulk_mark, args=(picked_students, date_str, "absent", select_key))
 
         st.markdown("---")
 
         for student in scheduled:
-            reschedule = next(
-                (r for r in st.session_state.reschedules
-                 if r["student_id"] == student["id"] and r["new_date"] == date_str and r["status"] == "active"),
-                None
-            )
-            time_display = reschedule["new_time"] if reschedule else get_time_for_day(student, day_name)
-            att = attendance_status(student["id"], date_str)
-
-            with st.expander(
-                f"{'✅' if att=='present' else '❌' if att=='absent' else '⏳'} "
-                f"{student['name']} — {time_display}",
-                expanded=(att is None)
-            ):
-                st.write(f"**Grade:** {student['grade']} | **Subject:** {student['subject']}")
-                if reschedule:
-                    st.info(f"🔄 Rescheduled from {reschedule['original_date']}")
-
-                bc1, bc2 = st.columns(2)
-                with bc1:
-                    p_type = "primary" if att == "present" else "secondary"
-                    if st.button("✅ Present", key=f"p_{student['id']}_{date_str}",
-                                 type=p_type, use_container_width=True):
-                        mark_attendance(student, date_str, "present")
-                with bc2:
-                    a_type = "primary" if att == "absent" else "secondary"
-                    if st.button("❌ Absent", key=f"a_{student['id']}_{date_str}",
-                                 type=a_type, use_container_width=True):
-                        mark_attendance(student, date_str, "absent")
+            attendance_card(student, day_name, date_str, scheduled, metrics_slot)
 
     # ── attendance history ──
     st.markdown("---")
@@ -578,13 +3390,21 @@ elif st.session_state.page == "attendance":
         if not st.session_state.students:
             st.info("No students yet.")
         else:
+            older = unloaded_years()
+            if older:
+                st.caption(f"Showing records from {max(older) + 1} onwards.")
+                if st.button(f"📂 Load older records ({min(older)}–{max(older)})",
+                             key="load_older_att", use_container_width=True):
+                    ensure_years_loaded(older)
+                    st.rerun()
             sel_student = st.selectbox(
                 "Select student",
                 st.session_state.students,
                 format_func=lambda s: s["name"]
             )
-            recs = [a for a in st.session_state.attendance if a["student_id"] == sel_student["id"]]
+            recs = list(get_attendance_index().for_student(sel_student["id"]).values())
             if recs:
+                import pandas as pd
                 df = pd.DataFrame(recs)[["date", "status"]].sort_values("date", ascending=False)
                 df.columns = ["Date", "Status"]
                 df["Status"] = df["Status"].str.capitalize()
@@ -596,6 +3416,69 @@ elif st.session_state.page == "attendance":
             else:
                 st.info("No attendance records yet.")
 
+    if st.button("📈 Attendance Analytics", use_container_width=True):
+        go("analytics")
+
+
+# ════════════════════════════════════════════════════════════
+# PAGE: ANALYTICS
+# ════════════════════════════════════════════════════════════
+elif st.session_state.page == "analytics":
+    import altair as alt
+    import pandas as pd
+    st.subheader("📈 Attendance Analytics")
+    if st.button("← Back to Attendance"):
+        go("attendance")
+
+    months = st.select_slider("Period", options=[1, 3, 6, 12, 24], value=3,
+                              format_func=lambda m: f"Last {m} month{'s' if m > 1 else ''}")
+    since = pd.Timestamp(date.today()) - pd.DateOffset(months=months)
+    ensure_years_loaded(range(since.year, date.today().year + 1))
+
+    df = get_attendance_frame().frame()
+    df = df[df["date"] >= since]
+    names = {s["id"]: s["name"] for s in st.session_state.students}
+    df = df[df["student_id"].isin(names.keys())]
+
+    if df.empty:
+        st.info("No attendance records in this period.")
+    else:
+        per_student, monthly_present, monthly_absent, daily = attendance_analytics(df)
+
+        c1, c2, c3 = st.columns(3)
+        c1.metric("Sessions marked", len(df))
+        c2.metric("Attendance rate", f"{df['present'].mean() * 100:.0f}%")
+        c3.metric("Students", len(per_student))
+
+        table = per_student.rename(index=names)[
+            ["present", "absent", "rate", "current_streak", "best_streak"]]
+        table.columns    = ["Present", "Absent", "Rate %", "Current streak", "Best streak"]
+        table.index.name = "Student"
+        st.dataframe(table.sort_values("Rate %"), use_container_width=True)
+
+        t1, t2 = st.tabs(["✅ Present by month", "❌ Absent by month"])
+        with t1:
+            st.dataframe(monthly_present.rename(index=names).rename_axis(index="Student", columns=None),
+                         use_container_width=True)
+        with t2:
+            st.dataframe(monthly_absent.rename(index=names).rename_axis(index="Student", columns=None),
+                         use_container_width=True)
+
+        st.markdown("##### 🗓️ Daily attendance")
+        pick = st.selectbox("Student", [None] + list(per_student.index),
+                            format_func=lambda sid: "All students" if sid is None else names[sid])
+        if pick is not None:
+            daily = attendance_analytics(df[df["student_id"] == pick])[3]
+        daily["week"]    = daily["date"].dt.to_period("W").dt.start_time
+        daily["weekday"] = daily["date"].dt.day_name().str[:3]
+        heatmap = alt.Chart(daily).mark_rect().encode(
+            x=alt.X("week:T", title=None, axis=alt.Axis(format="%d %b")),
+            y=alt.Y("weekday:N", title=None, sort=[d[:3] for d in DAY_NAMES]),
+            color=alt.Color("rate:Q", title="Present %", scale=alt.Scale(domain=[0, 100], scheme="greens")),
+            tooltip=[alt.Tooltip("date:T", format="%a %d %b %Y"), alt.Tooltip("rate:Q", format=".0f")],
+        )
+        st.altair_chart(heatmap, use_container_width=True)
+
 
 # ════════════════════════════════════════════════════════════
 # PAGE: FEES
@@ -606,6 +3489,9 @@ elif st.session_state.page == "fees":
     if not st.session_state.students:
         st.info("No students added yet.")
     else:
+        if st.button("📋 Arrears Report", use_container_width=True):
+            go("arrears")
+
         # month / year selector
         col_m, col_y = st.columns(2)
         with col_m:
@@ -613,23 +3499,15 @@ elif st.session_state.page == "fees":
                                      index=datetime.now().month - 1,
                                      format_func=lambda m: calendar.month_name[m])
         with col_y:
-            cur_year = datetime.now().year
-            sel_year = st.selectbox("Year", range(cur_year - 1, cur_year + 2), index=1)
+            cur_year  = datetime.now().year
+            fee_years = sorted(set(range(cur_year - 1, cur_year + 2)) | set(st.session_state.get("years", [])))
+            sel_year  = st.selectbox("Year", fee_years, index=fee_years.index(cur_year))
+        ensure_years_loaded([sel_year])
 
         st.markdown(f"### {calendar.month_name[sel_month]} {sel_year}")
 
-        total_exp = sum(float(s["monthly_fee"]) for s in st.session_state.students)
-        total_rec = sum(
-            float(s["monthly_fee"])
-            for s in st.session_state.students
-            if check_fee_status(s, sel_month, sel_year)
-        )
-        total_pen = total_exp - total_rec
-
-        m1, m2, m3 = st.columns(3)
-        m1.metric("Expected",  f"₹{total_exp:,.0f}")
-        m2.metric("Received",  f"₹{total_rec:,.0f}")
-        m3.metric("Pending",   f"₹{total_pen:,.0f}")
+        metrics_slot = st.empty()
+        summary = render_fee_metrics(metrics_slot, sel_month, sel_year)
 
         st.markdown("---")
 
@@ -637,50 +3515,71 @@ elif st.session_state.page == "fees":
         tab_pending, tab_paid = st.tabs(["⏳ Pending", "✅ Paid"])
 
         with tab_pending:
-            unpaid = [s for s in st.session_state.students if not check_fee_status(s, sel_month, sel_year)]
+            unpaid = summary["unpaid"]
             if not unpaid:
                 st.success("🎉 All fees collected!")
+            else:
+                select_key = f"bulk_pay_{sel_month}_{sel_year}"
+                names = {s["id"]: s["name"] for s in unpaid}
+                # drop picks that were paid one by one since the last run
+                st.session_state[select_key] = [sid for sid in st.session_state.get(select_key, []) if sid in names]
+                picked = st.multiselect("Collect several at once", list(names), key=select_key,
+                                        format_func=lambda sid: names[sid])
+                st.button(f"💰 Mark {len(picked)} selected as Paid", key=f"bulk_pay_btn_{sel_month}_{sel_year}",
+                          type="primary", disabled=not picked, use_container_width=True,
+                          on_click=_on_bulk_pay, args=(sel_month, sel_year, select_key))
             for student in unpaid:
-                with st.expander(f"💸 {student['name']} — ₹{student['monthly_fee']}"):
-                    st.write(f"**Grade:** {student['grade']} | **Subject:** {student['subject']}")
-                    if student.get("contact"):
-                        st.write(f"**Phone:** {student['contact']}")
-                    if st.button(f"💰 Mark as Paid", key=f"pay_{student['id']}_{sel_month}_{sel_year}",
-                                 type="primary", use_container_width=True):
-                        student["fees_paid"].append({
-                            "month":  sel_month,
-                            "year":   sel_year,
-                            "date":   datetime.now().isoformat(),
-                            "amount": student["monthly_fee"]
-                        })
-                        save_data()
-                        st.success(f"✅ ₹{student['monthly_fee']} received from {student['name']}")
-                        st.rerun()
+                fee_card(student, sel_month, sel_year, metrics_slot)
 
         with tab_paid:
-            paid = [s for s in st.session_state.students if check_fee_status(s, sel_month, sel_year)]
+            paid = summary["paid"]
             if not paid:
                 st.info("No fees marked as paid yet.")
-            for student in paid:
-                payment = next(
-                    (p for p in student.get("fees_paid", [])
-                     if p["month"] == sel_month and p["year"] == sel_year), {}
-                )
-                paid_on = payment.get("date", "")[:10] if payment else ""
-                with st.expander(f"✅ {student['name']} — ₹{student['monthly_fee']}"):
-                    st.write(f"**Grade:** {student['grade']} | **Subject:** {student['subject']}")
-                    if paid_on:
-                        st.caption(f"Paid on: {paid_on}")
-                    # allow un-marking
-                    if st.button(f"↩️ Mark as Unpaid", key=f"unpay_{student['id']}_{sel_month}_{sel_year}",
-                                 use_container_width=True):
-                        student["fees_paid"] = [
-                            p for p in student.get("fees_paid", [])
-                            if not (p["month"] == sel_month and p["year"] == sel_year)
-                        ]
-                        save_data()
-                        st.warning(f"↩️ Marked {student['name']} as unpaid")
-                        st.rerun()
+            for student, _ in paid:
+                fee_card(student, sel_month, sel_year, metrics_slot)
+
+
+# ════════════════════════════════════════════════════════════
+# PAGE: ARREARS
+# ════════════════════════════════════════════════════════════
+elif st.session_state.page == "arrears":
+    st.subheader("📋 Arrears Report")
+    if st.button("← Back to Fees"):
+        go("fees")
+
+    span = st.select_slider("Period", options=[3, 6, 12, 24, None], value=None,
+                            format_func=lambda m: "Since enrollment" if m is None else f"Last {m} months")
+    today = date.today()
+    last  = today.year * 12 + today.month - 1
+    first = 0 if span is None else last - span + 1
+    # enrollment months come from the full history, not just the years on screen
+    ensure_years_loaded(st.session_state.get("years", []) if span is None else range(first // 12, today.year + 1))
+    starts = enrollment_months(st.session_state.students, st.session_state.attendance)
+    per_student, per_month = arrears_report(st.session_state.students, starts, first, last)
+
+    if per_student.empty:
+        st.success("🎉 No outstanding fees in this period!")
+    else:
+        c1, c2, c3 = st.columns(3)
+        c1.metric("Outstanding", f"₹{per_student['owed'].sum():,.0f}")
+        c2.metric("Students owing", len(per_student))
+        c3.metric("Unpaid months", int(per_student["months"].sum()))
+
+        by_id = {s["id"]: s for s in st.session_state.students}
+        table = per_student.assign(
+            student=[by_id[sid]["name"] for sid in per_student.index],
+            grade=[by_id[sid]["grade"] for sid in per_student.index],
+            since=per_student["since"].map(month_label))
+        table = table.set_index("student")[["grade", "months", "owed", "since", "periods"]]
+        table.columns    = ["Grade", "Months", "Owed (₹)", "Oldest", "Unpaid months"]
+        table.index.name = "Student"
+        st.dataframe(table, use_container_width=True)
+
+        st.markdown("##### 📅 Outstanding by month")
+        months = per_month.rename(index=month_label)
+        months.columns    = ["Students", "Owed (₹)"]
+        months.index.name = "Month"
+        st.dataframe(months.iloc[::-1], use_container_width=True)
 
 
 # ════════════════════════════════════════════════════════════
@@ -714,26 +3613,34 @@ elif st.session_state.page == "reschedule":
                                           placeholder="e.g. 5:00 PM – 6:00 PM")
             reason        = st.text_input("📝 Reason (optional)", placeholder="Holiday, sick, etc.")
 
+            slot = normalize_slot(new_time.strip()) or get_time_for_day(student, original_date.strftime("%A"))
+            if new_time.strip() and not parse_slot(new_time):
+                st.warning("⚠️ Use a time like 4:00 PM – 5:00 PM")
+            for other, other_slot in get_schedule_index().clashes(new_date.strftime("%A"), slot,
+                                                                  exclude=student["id"], date_str=str(new_date)):
+                st.warning(f"⚠️ Overlaps {other['name']} ({other_slot}) on {new_date.strftime('%d %b')}")
+
             c1, c2 = st.columns(2)
             with c1:
                 if st.button("✅ Confirm Reschedule", type="primary", use_container_width=True):
                     if original_date == new_date:
                         st.error("Original and new dates must be different.")
+                    elif new_time.strip() and not parse_slot(new_time):
+                        st.error("Enter the new time like 5:00 PM – 6:00 PM, or leave it blank.")
                     else:
-                        orig_day_name  = original_date.strftime("%A")
-                        default_time   = get_time_for_day(student, orig_day_name)
-                        st.session_state.reschedules.append({
-                            "id":            next_student_id() + len(st.session_state.reschedules),
+                        resch = {
+                            "id":            next_reschedule_id(),
                             "student_id":    student["id"],
                             "student_name":  student["name"],
                             "original_date": str(original_date),
                             "new_date":      str(new_date),
-                            "new_time":      new_time.strip() if new_time.strip() else default_time,
+                            "new_time":      slot,
                             "reason":        reason,
                             "status":        "active",
                             "created_at":    datetime.now().isoformat()
-                        })
-                        save_data()
+                        }
+                        st.session_state.reschedules.append(resch)
+                        save_data({"op": "reschedule.put", "record": resch})
                         st.success(f"✅ {student['name']}'s class rescheduled to {new_date.strftime('%d %b %Y')}!")
                         st.balloons()
             with c2:
@@ -753,15 +3660,83 @@ elif st.session_state.page == "reschedule":
                             st.write(f"**Reason:** {r['reason']}")
                         if st.button("🗑️ Cancel Reschedule", key=f"cancel_r_{r['id']}", use_container_width=True):
                             r["status"] = "cancelled"
-                            save_data()
+                            save_data({"op": "reschedule.put", "record": r})
                             st.success("Reschedule cancelled.")
                             st.rerun()
 
+            # past reschedules live in the archive and are only read when asked for
+            st.markdown("---")
+            if st.toggle("📦 Show past reschedules", key="show_archive"):
+                try:
+                    archive = get_storage().load_archive()
+                except GistError as e:
+                    st.error(f"⚠️ Couldn't load the archive: {e}")
+                    archive = []
+                names = {s["id"]: s["name"] for s in st.session_state.students}
+                if not archive:
+                    st.caption("No past reschedules yet.")
+                else:
+                    st.dataframe([{"Student":  names.get(r["student_id"], r.get("student_name", "")),
+                                   "Original": r["original_date"],
+                                   "Moved to": f"{r['new_date']} {r.get('new_time', '')}",
+                                   "Status":   r["status"],
+                                   "Reason":   r.get("reason", "")}
+                                  for r in sorted(archive, key=lambda r: r["new_date"], reverse=True)],
+                                 use_container_width=True, hide_index=True)
+
+
+# ════════════════════════════════════════════════════════════
+# PAGE: DIAGNOSTICS
+# ════════════════════════════════════════════════════════════
+elif st.session_state.page == "diagnostics":
+    import pandas as pd
+    st.subheader("🩺 Diagnostics")
+    runs = list(get_perf_log().runs)
+    if not runs:
+        st.info("No runs recorded yet.")
+    else:
+        def _ms(run, prefix):
+            return sum(s["ms"] for k, s in run["spans"].items() if k.startswith(prefix))
+        table = pd.DataFrame([{
+            "At":         r["at"][11:],
+            "Run":        r["run"],
+            "Page":       r["page"],
+            "Status":     r["status"],
+            "Total ms":   r["total_ms"],
+            "Network ms": _ms(r, "gist."),
+            "JSON ms":    _ms(r, "json."),
+            "KB moved":   round(sum(s["bytes"] for k, s in r["spans"].items() if k.startswith("gist.")) / 1024, 1),
+        } for r in reversed(runs)])
+        st.caption(f"Last {len(runs)} runs in this server process, newest first.")
+        st.dataframe(table, use_container_width=True, hide_index=True)
+
+        pick = st.selectbox("Run", range(len(runs)),
+                            format_func=lambda i: f"{table['At'][i]} · {table['Run'][i]} · {table['Page'][i]}")
+        run = runs[-1 - pick]
+        c1, c2 = st.columns(2)
+        with c1:
+            st.markdown("**Sections (ms)**")
+            st.dataframe(pd.Series(run["sections"], name="ms", dtype="float64"), use_container_width=True)
+        with c2:
+            st.markdown("**Network and JSON**")
+            st.dataframe(pd.DataFrame(run["spans"]).T, use_container_width=True)
+        st.markdown("**Helper calls**")
+        st.dataframe(pd.DataFrame(run["calls"]).T.sort_values("ms", ascending=False) if run["calls"] else
+                     pd.DataFrame(), use_container_width=True)
+
+    with st.expander("Background saver (since the server started)"):
+        background = get_perf_log().background.summary()
+        st.dataframe(pd.DataFrame(background["spans"]).T, use_container_width=True)
+        st.dataframe(pd.DataFrame(background["calls"]).T, use_container_width=True)
+
+perf_section("page")
+
 
 # ════════════════════════════════════════════════════════════
 # SETUP GUIDE (shown when secrets not configured)
 # ════════════════════════════════════════════════════════════
-if not st.secrets.get("GIST_ID"):
+# only when saves have nowhere to go: SQLite keeps everything without a gist
+if get_storage().remote and not current_gist()[0]:
     with st.expander("⚙️ One-Time Setup: Enable Persistent Storage", expanded=False):
         st.warning("Data is NOT being saved permanently yet. Follow these steps once:")
         st.markdown("""
@@ -795,3 +3770,5 @@ That's it! All data will now persist forever. ✅
 # ── footer ──
 st.markdown("---")
 st.caption("Made with ❤️ for Mom  •  Data saves automatically")
+perf_section("footer")
+end_rerun()
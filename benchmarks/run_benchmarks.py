@@ -0,0 +1,172 @@
+"""Benchmarks for the helper layer, storage encoding and page renders.
+
+    python benchmarks/run_benchmarks.py                  # 200 students, 3 years
+    python benchmarks/run_benchmarks.py --students 1000 --years 5 --skip-pages
+
+Runs against a throwaway SQLite database in a temporary directory, so no
+gist is read or written. Helper timings are the best of --repeat runs, per
+call; page timings are one headless AppTest run per page, best of --repeat.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import timeit
+from datetime import date, timedelta
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+APP  = HERE.parent / "app.py"
+sys.path.insert(0, str(HERE))
+sys.path.insert(0, str(APP.parent))
+
+from synthetic import generate  # noqa: E402
+
+PAGES = ["home", "calendar", "students", "add_student", "data", "attendance", "analytics", "fees", "arrears",
+         "reschedule", "diagnostics"]
+
+# slots typed without AM/PM and the (start, end) minutes parse_slot must read them as
+BARE_SLOTS = {"4-5": (960, 1020), "7-8": (1140, 1200), "10-11": (600, 660), "11-12": (660, 720),
+              "11:30-12:30": (690, 750), "12-1": (720, 780), "5-4": None}
+
+
+def secrets_for(workdir):
+    return {"GIST_ID": "", "STORAGE_BACKEND": "sqlite", "SQLITE_PATH": str(Path(workdir) / "bench.db")}
+
+
+def best(fn, number, repeat):
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) / number
+
+
+def report(name, seconds):
+    unit, scale = ("ms", 1e3) if seconds >= 1e-3 else ("µs", 1e6)
+    print(f"  {name:<42} {seconds * scale:>10.2f} {unit}")
+
+
+def check_slots(app):
+    wrong = [(text, app.parse_slot(text), want) for text, want in BARE_SLOTS.items() if app.parse_slot(text) != want]
+    for text, got, want in wrong:
+        print(f"FAIL parse_slot({text!r}) = {got}, expected {want}")
+    return not wrong
+
+
+def bench_helpers(app, data, repeat):
+    st = app.st
+    st.session_state.students    = data["students"]
+    st.session_state.attendance  = data["attendance"]
+    st.session_state.reschedules = data["reschedules"]
+    st.session_state.years        = []
+    st.session_state.loaded_years = None
+
+    today    = date.today()
+    dates    = [today - timedelta(days=n) for n in range(60)]
+    students = data["students"]
+    sample   = students[:: max(len(students) // 50, 1)]
+
+    print("helpers (per call)")
+    st.session_state.pop("schedule_index", None)
+    report("ScheduleIndex build", best(lambda: app.ScheduleIndex(students, data["reschedules"]), 1, repeat))
+    report("get_students_for_day", best(
+        lambda: [app.get_students_for_day(d.strftime("%A"), d) for d in dates], 1, repeat) / len(dates))
+    report("occurrences (one year)", best(
+        lambda: app.get_schedule_index().occurrences(today - timedelta(days=365), today), 1, repeat))
+
+    st.session_state.pop("attendance_index", None)
+    report("AttendanceIndex build", best(lambda: app.AttendanceIndex(data["attendance"]), 1, repeat))
+    app.get_attendance_index()
+    report("attendance_status", best(
+        lambda: [app.attendance_status(s["id"], str(d)) for s in sample for d in dates], 1, repeat)
+        / (len(sample) * len(dates)))
+
+    st.session_state.pop("fee_ledger", None)
+    report("FeeLedger build", best(lambda: app.FeeLedger(students), 1, repeat))
+    app.get_fee_ledger()
+    report("check_fee_status", best(
+        lambda: [app.check_fee_status(s, m, today.year) for s in sample for m in range(1, 13)], 1, repeat)
+        / (len(sample) * 12))
+
+    # every call writes one row to the benchmark database
+    marks = iter(range(10 ** 9))
+    def mark():
+        n = next(marks)
+        app.mark_attendance(students[n % len(students)], str(today + timedelta(days=1 + n // len(students))),
+                            "present")
+    app.get_storage().save(app.get_all_data())
+    report("mark_attendance (SQLite write)", best(mark, 20, repeat))
+
+
+def bench_storage(app, data, repeat):
+    print("load / save (whole dataset)")
+    doc  = app.to_json(app.encode_document(data))
+    old  = json.dumps(data, indent=2)
+    print(f"  {'schema 1 / schema 2 size':<42} {len(old) / 1e6:>7.2f} MB / {len(doc) / 1e6:.2f} MB")
+    report("save: encode_document + to_json", best(lambda: app.to_json(app.encode_document(data)), 1, repeat))
+    report("load: json.loads + decode_document", best(lambda: app.decode_document(json.loads(doc)), 1, repeat))
+    report("load: schema 1 json.loads", best(lambda: json.loads(old), 1, repeat))
+
+    parted = dict(data, years=sorted({int(a["date"][:4]) for a in data["attendance"]}))
+    files  = app.split_partitions(parted)
+    report("save: split_partitions (all files)", best(lambda: app.split_partitions(parted), 1, repeat))
+    gist = {name: {"content": f["content"]} for name, f in files.items()}
+    report("load: partitioned, hot years", best(
+        lambda: app.assemble_partitions(app._parse_gist(gist), app.hot_years()), 1, repeat))
+    report("load: partitioned, all years", best(
+        lambda: app.assemble_partitions(app._parse_gist(gist)), 1, repeat))
+
+
+def bench_pages(data, workdir, repeat):
+    from streamlit.testing.v1 import AppTest
+
+    print("pages (one full run)")
+    for page in PAGES:
+        def run():
+            at = AppTest.from_file(str(APP), default_timeout=120)
+            for key, value in secrets_for(workdir).items():
+                at.secrets[key] = value
+            for key in ("students", "attendance", "reschedules"):
+                at.session_state[key] = [dict(r) for r in data[key]]
+            at.session_state["data_loaded"] = True
+            at.session_state["page"] = page
+            start = time.perf_counter()
+            at.run()
+            elapsed = time.perf_counter() - start
+            if at.exception:
+                raise RuntimeError(f"{page}: {at.exception[0].value}")
+            return elapsed
+        report(page, min(run() for _ in range(repeat)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students",   type=int, default=200)
+    parser.add_argument("--years",      type=int, default=3)
+    parser.add_argument("--seed",       type=int, default=0)
+    parser.add_argument("--repeat",     type=int, default=3)
+    parser.add_argument("--skip-pages", action="store_true")
+    args = parser.parse_args()
+
+    data = generate(args.students, args.years, args.seed)
+    print(f"{len(data['students'])} students, {len(data['attendance'])} attendance records, "
+          f"{sum(len(s['fees_paid']) for s in data['students'])} payments, "
+          f"{len(data['reschedules'])} reschedules")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # app.py reads .streamlit/secrets.toml from the working directory
+        (Path(workdir) / ".streamlit").mkdir()
+        (Path(workdir) / ".streamlit" / "secrets.toml").write_text(
+            "".join(f'{k} = "{v}"\n' for k, v in secrets_for(workdir).items()))
+        os.chdir(workdir)
+        import app
+
+        slots_ok = check_slots(app)
+        bench_helpers(app, generate(args.students, args.years, args.seed), args.repeat)
+        bench_storage(app, data, args.repeat)
+        if not args.skip_pages:
+            bench_pages(data, workdir, args.repeat)
+    sys.exit(0 if slots_ok else 1)
+
+
+if __name__ == "__main__":
+    main()
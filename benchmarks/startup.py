@@ -0,0 +1,100 @@
+"""Cold-start budget: module imports and first paint of the Today page.
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --import-budget 500 --paint-budget 1200
+
+Each measurement runs in a fresh interpreter, as on a cold start of the
+hosting container. Exits non-zero if a budget is exceeded or if a module
+that should load on first use (pandas, altair) was imported for the Today page.
+"""
+import argparse
+import ast
+import json
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+APP  = HERE.parent / "app.py"
+
+IMPORT_BUDGET_MS      = 250
+FIRST_PAINT_BUDGET_MS = 1000
+LAZY_MODULES          = ["pandas", "altair"]
+
+IMPORTS_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+{imports}
+print(json.dumps({{"ms": (time.perf_counter() - started) * 1000}}))
+"""
+
+PAINT_PROBE = """
+import json, sys, time
+sys.path.insert(0, {bench!r})
+from synthetic import generate
+from streamlit.testing.v1 import AppTest
+data = generate(students=50, years=2)
+at = AppTest.from_file({app!r}, default_timeout=60)
+at.secrets["GIST_ID"] = ""
+at.secrets["STORAGE_BACKEND"] = "sqlite"
+at.secrets["SQLITE_PATH"] = {db!r}
+for key in ("students", "attendance", "reschedules"):
+    at.session_state[key] = data[key]
+at.session_state["data_loaded"] = True
+started = time.perf_counter()
+at.run()
+ms = (time.perf_counter() - started) * 1000
+print(json.dumps({{"ms": ms, "error": [str(e.value) for e in at.exception],
+                   "loaded": [m for m in {lazy!r} if m in sys.modules]}}))
+"""
+
+
+def top_level_imports():
+    """The import statements app.py runs before anything else."""
+    tree = ast.parse(APP.read_text())
+    return "\n".join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+
+def probe(code, cwd):
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=cwd)
+    lines = [line for line in out.stdout.splitlines() if line.startswith("{")]
+    if out.returncode or not lines:
+        sys.exit(f"probe failed:\n{out.stderr[-2000:]}")
+    return json.loads(lines[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--import-budget", type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument("--paint-budget",  type=float, default=FIRST_PAINT_BUDGET_MS)
+    parser.add_argument("--repeat",        type=int,   default=3)
+    args = parser.parse_args()
+
+    failures = []
+    with tempfile.TemporaryDirectory() as workdir:
+        imports = min(probe(IMPORTS_PROBE.format(imports=top_level_imports()), workdir)["ms"]
+                      for _ in range(args.repeat))
+        paints = [probe(PAINT_PROBE.format(bench=str(HERE), app=str(APP), lazy=LAZY_MODULES,
+                                           db=str(Path(workdir) / "startup.db")), workdir)
+                  for _ in range(args.repeat)]
+
+    paint = min(p["ms"] for p in paints)
+    print(f"  {'module imports':<24} {imports:>8.1f} ms   (budget {args.import_budget:.0f} ms)")
+    print(f"  {'first paint (Today)':<24} {paint:>8.1f} ms   (budget {args.paint_budget:.0f} ms)")
+    if imports > args.import_budget:
+        failures.append("module imports over budget")
+    if paint > args.paint_budget:
+        failures.append("first paint over budget")
+    if paints[0]["error"]:
+        failures.append(f"Today page raised: {paints[0]['error']}")
+    if paints[0]["loaded"]:
+        failures.append(f"loaded on first paint but should load on first use: {', '.join(paints[0]['loaded'])}")
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Synthetic tuition datasets for the benchmarks.
+
+generate() returns data in the shape the app keeps in st.session_state:
+students (with fees_paid), attendance and reschedules. Students join at
+random points over the history, attend two to four weekly slots, miss about
+one class in eight and usually pay each month's fee early in the month.
+"""
+import random
+from datetime import date, datetime, timedelta
+
+DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+SUBJECTS  = ["Maths", "Science", "English", "Physics", "Chemistry", "Biology", "Accounts"]
+GRADES    = [f"{g}th" for g in range(5, 13)]
+SLOTS     = ["3:00 PM – 4:00 PM", "4:00 PM – 5:00 PM", "5:00 PM – 6:00 PM",
+             "6:00 PM – 7:00 PM", "7:00 PM – 8:00 PM"]
+
+
+def _months(start, end):
+    y, m = start.year, start.month
+    while (y, m) <= (end.year, end.month):
+        yield y, m
+        y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+
+
+def generate(students=200, years=3, seed=0, today=None):
+    rng   = random.Random(seed)
+    today = today or date.today()
+    first = today.replace(year=today.year - years + 1, month=1, day=1)
+
+    data = {"students": [], "attendance": [], "reschedules": []}
+    for sid in range(1, students + 1):
+        joined = first + timedelta(days=rng.randrange((today - first).days + 1))
+        days   = rng.sample(DAY_NAMES[:6], rng.randint(2, 4))
+        fee    = rng.choice(range(1000, 5001, 250))
+        student = {
+            "id":          sid,
+            "name":        f"Student {sid:04d}",
+            "grade":       rng.choice(GRADES),
+            "subject":     rng.choice(SUBJECTS),
+            "time_slot":   {d: rng.choice(SLOTS) for d in sorted(days, key=DAY_NAMES.index)},
+            "monthly_fee": fee,
+            "contact":     f"98{rng.randrange(10**8):08d}",
+            "fees_paid":   [],
+        }
+        data["students"].append(student)
+
+        for year, month in _months(joined, today):
+            if rng.random() < 0.9:
+                paid = datetime(year, month, min(rng.randint(1, 10), 28), rng.randint(9, 20), rng.randrange(60))
+                if paid.date() <= today:
+                    student["fees_paid"].append(
+                        {"month": month, "year": year, "date": paid.isoformat(), "amount": fee})
+
+        weekdays = {DAY_NAMES.index(d) for d in days}
+        day = joined
+        while day < today:
+            if day.weekday() in weekdays:
+                data["attendance"].append({
+                    "student_id":   sid,
+                    "student_name": student["name"],
+                    "date":         day.isoformat(),
+                    "status":       "absent" if rng.random() < 0.12 else "present",
+                    "timestamp":    datetime.combine(day, datetime.min.time())
+                                    .replace(hour=rng.randint(15, 20), minute=rng.randrange(60)).isoformat(),
+                })
+            day += timedelta(days=1)
+
+        for _ in range(rng.randint(0, 2 * years)):
+            original = joined + timedelta(days=rng.randrange(max((today - joined).days, 1) + 30))
+            data["reschedules"].append({
+                "id":            len(data["reschedules"]) + 1,
+                "student_id":    sid,
+                "student_name":  student["name"],
+                "original_date": original.isoformat(),
+                "new_date":      (original + timedelta(days=rng.randint(1, 3))).isoformat(),
+                "new_time":      rng.choice(SLOTS),
+                "reason":        rng.choice(["", "Holiday", "Exam", "Sick"]),
+                "status":        "active" if original >= today else rng.choice(["active", "cancelled"]),
+                "created_at":    datetime.combine(original - timedelta(days=2), datetime.min.time()).isoformat(),
+            })
+    return data